@@ -1,81 +1,381 @@
-import hashlib
 import json
 import os
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import NamedTuple, Iterator
 
+from cache.lru_cache import LRUCache
+from cache.schema import migrate, register_functions, serialize, sha256
 from pipeline_modules.module import ModuleConfiguration
 
-cache: 'CacheManager | None'  # TODO: make actual Singleton or even better: find a good solution
+
+class _ThreadConnection:
+    """Holds the connection of one thread and closes it when the thread's slot is cleared,
+    i.e. when the thread ends or the cache is closed."""
+    connection: sqlite3.Connection
+    pid: int
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.pid = os.getpid()
+        weakref.finalize(self, _ThreadConnection.__close, connection, self.pid)
+
+    @staticmethod
+    def __close(connection: sqlite3.Connection, pid: int):
+        # A forked process must not close the connections of its parent, closing could checkpoint the parent's WAL
+        if os.getpid() == pid:
+            connection.close()
+
+
+class CacheHandle(NamedTuple):
+    """The key columns of a module configuration, computed once instead of on every cache access."""
+    module: str
+    name: str
+    config_hash: str
+    config: str
 
 
 class CacheManager:
+    """Caches results of pipeline modules in a SQLite database.
+
+    A CacheManager can be shared by threads, and several processes can use the same database file.
+    Every thread uses its own connection and the database is kept in WAL mode, so readers do not block the writer.
+    Opened caches are registered by their database path. get_cache() returns the one opened most recently."""
+    # Milliseconds a connection waits for the write lock held by another thread or process
+    __BUSY_TIMEOUT = 60000
+    # SQLite limits the number of host parameters per statement
+    __BATCH_SIZE = 500
+    # Rough per-row overhead of the decoded entries, in addition to the size of their json representation
+    __ROW_OVERHEAD = 64
+    # Share of the rows deleted at once while shrinking the database to its maximum size
+    __EVICTION_STEP = 0.05
+    # Module type matching all modules in time to live configurations
+    ALL_MODULES = "*"
+
+    __instances: dict[str, 'CacheManager'] = {}
+    __current: 'CacheManager | None' = None
+    __registry_lock = threading.Lock()
+
     __folder_path: str
     __database_name: str
+    __database_path: str
 
-    __connection: sqlite3.Connection
-    __cursor: sqlite3.Cursor
+    # _ThreadConnection of every thread. It is only referenced by its thread's slot, so the connection is closed
+    # when its thread ends, e.g. when a thread pool is shut down
+    __local: threading.local
+    __handles: dict[int, tuple[ModuleConfiguration, CacheHandle]]
+    __memory: LRUCache
+    __blob_threshold: int
+    __vacuum_threshold: float
+    __store_inputs: bool
 
-    def __init__(self, database_name: str, folder_path: str = "./storage"):
+    def __init__(self, database_name: str, folder_path: str = "./storage",
+                 memory_entries: int = 50000, memory_bytes: int = 128 * 1024 * 1024, blob_threshold: int = 1024,
+                 vacuum_threshold: float = 0.25, store_inputs: bool = False):
+        """memory_entries and memory_bytes bound the in-memory cache in front of the database.
+        An entry holds all rows of one input key.
+        Data larger than blob_threshold characters is stored as a content-addressed blob instead of inline.
+        After evicting entries, the database file is vacuumed once vacuum_threshold of its pages are unused.
+        Rows are looked up by the hash of their input, the input itself is only stored if store_inputs is set."""
         self.__database_name = database_name
         self.__folder_path = folder_path
-        if not os.path.exists(self.__folder_path):
-            os.makedirs(self.__folder_path)
-        self.__connection = sqlite3.connect(self.__folder_path + "/" + self.__database_name + ".sqlite3")
-        self.__cursor = self.__connection.cursor()
-
-        # Init table
-        self.__create_cache_table()
-
-        global cache
-        cache = self
-
-    def __create_cache_table(self):
-        self.__cursor.execute('''CREATE TABLE IF NOT EXISTS cache(
-                                        module TEXT,
-                                        name TEXT, 
-                                        config_hash TEXT, 
-                                        config TEXT,
-                                        input_hash TEXT, 
-                                        input TEXT,
-                                        data JSON,
-                                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        self.__connection.commit()
-
-    def __hash(self, data: str) -> str:
-        sha256 = hashlib.sha256()
-        sha256.update(data.encode())
-        return sha256.hexdigest()
+        self.__database_path = self.database_path(database_name, folder_path)
+        os.makedirs(self.__folder_path, exist_ok=True)
+        self.__local = threading.local()
+        self.__handles = dict()
+        self.__memory = LRUCache(max_entries=memory_entries, max_bytes=memory_bytes)
+        self.__blob_threshold = blob_threshold
+        self.__vacuum_threshold = vacuum_threshold
+        self.__store_inputs = store_inputs
+
+        # Init table or migrate existing databases
+        connection = self.__connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        migrate(connection)
+
+        with CacheManager.__registry_lock:
+            CacheManager.__instances[self.__database_path] = self
+            CacheManager.__current = self
+
+    @staticmethod
+    def database_path(database_name: str, folder_path: str) -> str:
+        return os.path.abspath(os.path.join(folder_path, database_name + ".sqlite3"))
+
+    @classmethod
+    def open(cls, database_name: str, folder_path: str = "./storage", **kwargs) -> 'CacheManager':
+        """Returns the already opened cache of the database or opens it. It becomes the cache returned by get_cache()."""
+        with cls.__registry_lock:
+            instance = cls.__instances.get(cls.database_path(database_name, folder_path))
+            if instance is not None:
+                cls.__current = instance
+                return instance
+        return cls(database_name, folder_path, **kwargs)
+
+    def __connection(self) -> sqlite3.Connection:
+        """Returns the connection of the calling thread. Forked processes open their own connections."""
+        thread_connection = getattr(self.__local, "connection", None)
+        if thread_connection is None or thread_connection.pid != os.getpid():
+            # Transactions are started explicitly, see __transaction.
+            # The connection is only used by this thread, but closed by the thread clearing its slot.
+            connection = sqlite3.connect(self.__database_path, timeout=self.__BUSY_TIMEOUT / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout={self.__BUSY_TIMEOUT}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            register_functions(connection)
+            thread_connection = _ThreadConnection(connection)
+            self.__local.connection = thread_connection
+        return thread_connection.connection
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs the block as a write transaction. The write lock is taken at the start, so concurrent writers
+        wait for each other instead of failing when a read transaction is upgraded."""
+        connection = self.__connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self):
+        """Closes the connections of all threads and unregisters the cache."""
+        # Dropping the slots closes their connections
+        self.__local = threading.local()
+        with CacheManager.__registry_lock:
+            if CacheManager.__instances.get(self.__database_path) is self:
+                del CacheManager.__instances[self.__database_path]
+            if CacheManager.__current is self:
+                CacheManager.__current = None
+
+    def handle(self, configuration: ModuleConfiguration) -> CacheHandle:
+        """Returns the precomputed key columns of the configuration.
+        The arguments are captured on first use, so they must not be changed afterwards."""
+        # The configuration is kept with its handle so its id cannot be reused by another object
+        entry = self.__handles.get(id(configuration))
+        if entry is None:
+            config = json.dumps(configuration.args, sort_keys=True)
+            handle = CacheHandle(module=configuration.type,
+                                 name=configuration.name,
+                                 config_hash=sha256(config),
+                                 config=config)
+            entry = self.__handles.setdefault(id(configuration), (configuration, handle))
+        return entry[1]
 
     def put(self, configuration: ModuleConfiguration, input: str, data: dict):
-        parameters = {
-            "module": configuration.type,
-            "name": configuration.name,
-            "config_hash": self.__hash(json.dumps(configuration.args, sort_keys=True)),
-            "config": json.dumps(configuration.args, sort_keys=True),
-            "input_hash": self.__hash(input),
-            "input": input,
-            "data": json.dumps(data, sort_keys=True),
-        }
-        self.__cursor.execute("INSERT INTO cache (module, name, config_hash, config, input_hash, input, data) "
-                              "VALUES (:module, :name, :config_hash, :config, :input_hash, :input, json(:data))",
-                              parameters)
-        self.__connection.commit()
+        self.put_many(configuration, [(input, data)])
+
+    def put_many(self, configuration: ModuleConfiguration, entries: list[tuple[str, dict]]):
+        """Stores all (input, data) entries in a single transaction. Entries that are already stored are skipped.
+        Large data and, if store_inputs is set, inputs are written to the blob table once,
+        no matter how many rows refer to them."""
+        handle = self.handle(configuration)
+        blobs: dict[str, str] = {handle.config_hash: handle.config}
+        input_hashes: dict[str, str] = dict()
+        parameters = list()
+        for input, data in entries:
+            input_hash = input_hashes.get(input)
+            if input_hash is None:
+                input_hash = sha256(input)
+                input_hashes[input] = input_hash
+                if self.__store_inputs:
+                    blobs[input_hash] = input
+
+            serialized = serialize(data)
+            data_hash = sha256(serialized)
+            if len(serialized) > self.__blob_threshold:
+                blobs[data_hash] = serialized
+            parameters.append({
+                "module": handle.module,
+                "name": handle.name,
+                "config_hash": handle.config_hash,
+                "input_hash": input_hash,
+                "data_hash": data_hash,
+                "data": serialized if len(serialized) <= self.__blob_threshold else None,
+                "serialized": serialized,
+            })
+        inserted = list()
+        with self.__transaction() as connection:
+            connection.executemany("INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)", blobs.items())
+            for parameter in parameters:
+                cursor = connection.execute("INSERT INTO cache (module, name, config_hash, input_hash, data_hash, data) "
+                                            "SELECT :module, :name, :config_hash, :input_hash, :data_hash, json(:data) "
+                                            "WHERE NOT EXISTS (SELECT 1 FROM cache WHERE module=:module "
+                                            "AND name=:name AND config_hash=:config_hash AND input_hash=:input_hash "
+                                            "AND data_hash=:data_hash)",
+                                            parameter)
+                if cursor.rowcount > 0:
+                    inserted.append(parameter)
+        for parameter in inserted:
+            self.__remember_put(handle, parameter["input_hash"], parameter["serialized"])
 
     def get(self, configuration: ModuleConfiguration, input_key: str) -> list[dict]:
-        parameters = {
-            "module": configuration.type,
-            "name": configuration.name,
-            "config_hash": self.__hash(json.dumps(configuration.args, sort_keys=True)),
-            "input_hash": self.__hash(input_key),
-        }
-        data = self.__cursor.execute("SELECT data FROM cache WHERE module=:module AND name=:name AND config_hash=:config_hash AND input_hash=:input_hash", parameters)
-
-        result: list[dict] = list()
-        for row in data:
-            result.append(json.loads(row[0]))
-        return result
+        return self.get_many(configuration, [input_key])[0]
+
+    def get_many(self, configuration: ModuleConfiguration, input_keys: list[str]) -> list[list[dict]]:
+        """Looks up all input keys at once. The result contains the cached data of each key in the given order."""
+        handle = self.handle(configuration)
+        input_hashes = [sha256(input_key) for input_key in input_keys]
+        rows: dict[str, list[dict]] = dict()
+        sizes: dict[str, int] = dict()
+        for input_hash in input_hashes:
+            if input_hash not in rows:
+                cached = self.__memory.get(self.__memory_key(handle, input_hash))
+                if cached is not None:
+                    rows[input_hash] = cached
+                else:
+                    rows[input_hash] = list()
+                    sizes[input_hash] = 0
+
+        unloaded_hashes = list(sizes)
+        connection = self.__connection()
+        for start in range(0, len(unloaded_hashes), self.__BATCH_SIZE):
+            batch = unloaded_hashes[start:start + self.__BATCH_SIZE]
+            data = connection.execute("SELECT cache.input_hash, COALESCE(cache.data, blobs.content) FROM cache "
+                                      "LEFT JOIN blobs ON cache.data IS NULL AND blobs.hash = cache.data_hash "
+                                      "WHERE cache.module=? AND cache.name=? AND cache.config_hash=? "
+                                      f"AND cache.input_hash IN ({','.join('?' * len(batch))}) "
+                                      "ORDER BY cache.rowid",
+                                      (handle.module, handle.name, handle.config_hash, *batch))
+            for input_hash, row in data:
+                rows[input_hash].append(json.loads(row))
+                sizes[input_hash] += len(row) + self.__ROW_OVERHEAD
+
+        # Only keys with rows are remembered, misses would stay stale once another process puts their rows
+        for input_hash, size in sizes.items():
+            if rows[input_hash]:
+                self.__memory.put(self.__memory_key(handle, input_hash), rows[input_hash],
+                                  size + self.__ROW_OVERHEAD)
+
+        return [list(rows[input_hash]) for input_hash in input_hashes]
+
+    def __memory_key(self, handle: CacheHandle, input_hash: str) -> tuple[str, str, str, str]:
+        return handle.module, handle.name, handle.config_hash, input_hash
+
+    def __remember_put(self, handle: CacheHandle, input_hash: str, serialized: str):
+        """Appends a new row to the in-memory entry of its key. Unknown keys are left to be loaded on demand,
+        as the database might hold further rows for them."""
+        key = self.__memory_key(handle, input_hash)
+        entry = self.__memory.peek(key)
+        if entry is not None:
+            rows, size = entry
+            self.__memory.put(key, rows + [json.loads(serialized)], size + len(serialized) + self.__ROW_OVERHEAD)
+
+    def compact(self):
+        """Moves inputs, configurations and large data of rows written before blob storage into the blob table
+        and shrinks the database file. This only needs to run once for databases created by older versions."""
+        with self.__transaction() as connection:
+            connection.execute("INSERT OR IGNORE INTO blobs (hash, content) "
+                               "SELECT input_hash, input FROM cache WHERE input IS NOT NULL")
+            connection.execute("INSERT OR IGNORE INTO blobs (hash, content) "
+                               "SELECT config_hash, config FROM cache WHERE config IS NOT NULL")
+            connection.execute("UPDATE cache SET input = NULL, config = NULL "
+                               "WHERE input IS NOT NULL OR config IS NOT NULL")
+            connection.execute("UPDATE cache SET data_hash = canonical_hash(data) WHERE data_hash IS NULL")
+            connection.execute("INSERT OR IGNORE INTO blobs (hash, content) "
+                               "SELECT data_hash, data FROM cache WHERE length(data) > ?", (self.__blob_threshold,))
+            connection.execute("UPDATE cache SET data = NULL WHERE length(data) > ?", (self.__blob_threshold,))
+        self.vacuum(force=True)
+
+    def collapse_duplicates(self) -> int:
+        """Deletes all but the oldest of the rows sharing key and data. Returns the number of deleted rows."""
+        with self.__transaction() as connection:
+            deleted = connection.execute("DELETE FROM cache WHERE rowid NOT IN ("
+                                         "SELECT MIN(rowid) FROM cache "
+                                         "GROUP BY module, name, config_hash, input_hash, "
+                                         "COALESCE(data_hash, canonical_hash(data)))").rowcount
+        self.__memory.clear()
+        return deleted
+
+    def expire(self, time_to_live: dict[str, timedelta]) -> int:
+        """Deletes rows older than the time to live of their module type, e.g. {"classifier": timedelta(days=30)}.
+        ALL_MODULES applies to module types without their own entry. Returns the number of deleted rows."""
+        deleted = 0
+        with self.__transaction() as connection:
+            for module, ttl in time_to_live.items():
+                if module == self.ALL_MODULES:
+                    others = [other for other in time_to_live if other != self.ALL_MODULES]
+                    condition = f"module NOT IN ({','.join('?' * len(others))})"
+                    parameters = others
+                else:
+                    condition = "module = ?"
+                    parameters = [module]
+                deleted += connection.execute(f"DELETE FROM cache WHERE {condition} "
+                                              "AND timestamp < datetime('now', ?)",
+                                              (*parameters, f"-{int(ttl.total_seconds())} seconds")).rowcount
+        self.__memory.clear()
+        return deleted
+
+    def __page_statistics(self) -> tuple[int, int, int]:
+        connection = self.__connection()
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return page_size, page_count, free_pages
+
+    def used_bytes(self) -> int:
+        """The size the database file would have after vacuuming."""
+        page_size, page_count, free_pages = self.__page_statistics()
+        return (page_count - free_pages) * page_size
+
+    def enforce_max_size(self, max_bytes: int) -> int:
+        """Deletes the oldest rows until the stored data fits into max_bytes. Returns the number of deleted rows."""
+        deleted = 0
+        while self.used_bytes() > max_bytes:
+            rows = self.__connection().execute("SELECT count(*) FROM cache").fetchone()[0]
+            if rows == 0:
+                break
+            with self.__transaction() as connection:
+                deleted += connection.execute("DELETE FROM cache WHERE rowid IN "
+                                              "(SELECT rowid FROM cache ORDER BY timestamp, rowid LIMIT ?)",
+                                              (max(1, int(rows * self.__EVICTION_STEP)),)).rowcount
+            self.collect_garbage()
+        self.__memory.clear()
+        return deleted
+
+    def collect_garbage(self) -> int:
+        """Deletes blobs no row refers to anymore. Returns the number of deleted blobs."""
+        with self.__transaction() as connection:
+            return connection.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT input_hash FROM cache) "
+                                      "AND hash NOT IN (SELECT config_hash FROM cache) "
+                                      "AND hash NOT IN (SELECT data_hash FROM cache WHERE data_hash IS NOT NULL)"
+                                      ).rowcount
+
+    def vacuum(self, force: bool = False) -> bool:
+        """Rebuilds the database file if at least vacuum_threshold of its pages are unused.
+        Returns whether the database was vacuumed."""
+        _, page_count, free_pages = self.__page_statistics()
+        if force or (page_count > 0 and free_pages / page_count >= self.__vacuum_threshold):
+            connection = self.__connection()
+            connection.execute("VACUUM")
+            # Release the space of the write-ahead log as well
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return True
+        return False
+
+    def evict(self, max_bytes: int | None = None, time_to_live: dict[str, timedelta] | None = None) -> dict[str, int]:
+        """Runs all eviction steps: duplicate collapse, expiry by time to live, size limit and blob garbage collection.
+        The database is vacuumed afterwards if enough pages became unused."""
+        summary = {"duplicates": self.collapse_duplicates()}
+        if time_to_live:
+            summary["expired"] = self.expire(time_to_live)
+        summary["blobs"] = self.collect_garbage()
+        if max_bytes is not None:
+            summary["evicted"] = self.enforce_max_size(max_bytes)
+        summary["vacuumed"] = int(self.vacuum())
+        return summary
+
+    def memory_statistics(self) -> dict[str, int]:
+        """Returns size, hit, miss and eviction counters of the in-memory cache."""
+        return self.__memory.statistics()
 
     @classmethod
     def get_cache(cls) -> 'CacheManager':
-        global cache
+        cache = cls.__current
+        if cache is None:
+            raise RuntimeError("No cache has been opened. Use CacheManager.open() before running the pipeline.")
         return cache
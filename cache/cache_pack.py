@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+from cache.schema import SCHEMA_VERSION, migrate, register_functions, serialize, sha256
+from pipeline_modules.embedding_creator.memory_mapped_embedding_store import MemoryMappedEmbeddingStore
+
+# A cache pack is a zip archive with
+#   manifest.json  format, version, filters, counts and the sha256 of every other member
+#   cache.sqlite3  the deduplicated cache rows of all exported databases, in the current schema
+#   embeddings/    the files of the exported embedding folders (LocalFileStore keys are content hashes)
+#                  and the merged memory-mapped embedding stores, one folder per namespace
+PACK_FORMAT = "cache-pack"
+PACK_VERSION = 1
+MANIFEST = "manifest.json"
+DATABASE = "cache.sqlite3"
+EMBEDDINGS = "embeddings/"
+
+# Rows written per transaction while building or merging packs
+_BATCH_SIZE = 1000
+
+
+def _file_hash(file) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _member_path(folder: str, member: str) -> str:
+    """Returns the path of a pack member below folder. Raises a ValueError for members that would be written
+    outside of folder, e.g. with absolute paths or .. parts."""
+    root = os.path.realpath(folder)
+    path = os.path.realpath(os.path.join(root, *member.split("/")))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"Cache pack member {member} is outside of {folder}")
+    return path
+
+
+def _connect(database_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(database_path, isolation_level=None)
+    register_functions(connection)
+    migrate(connection)
+    return connection
+
+
+def _row_filter(modules: list[str] | None, names: list[str] | None,
+                config_hashes: list[str] | None) -> tuple[str, list[str]]:
+    conditions = []
+    parameters = []
+    for column, values in (("module", modules), ("name", names), ("config_hash", config_hashes)):
+        if values:
+            conditions.append(f"cache.{column} IN ({','.join('?' * len(values))})")
+            parameters.extend(values)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+
+def _export_database(pack: sqlite3.Connection, database_path: str, where: str, parameters: list[str],
+                     blob_threshold: int, include_inputs: bool) -> tuple[int, int]:
+    """Copies the matching rows of a database into the pack, skipping rows the pack already contains.
+    Returns the number of read and of exported rows."""
+    source = _connect(database_path)
+    # Rows of databases that were never compacted still keep their input, config and data inline
+    rows = source.execute(f'''SELECT cache.module, cache.name, cache.config_hash,
+                                     COALESCE(cache.config, config.content),
+                                     cache.input_hash, COALESCE(cache.input, input.content),
+                                     COALESCE(cache.data, data.content), cache.data_hash, cache.timestamp
+                              FROM cache
+                              LEFT JOIN blobs config ON cache.config IS NULL AND config.hash = cache.config_hash
+                              LEFT JOIN blobs input ON cache.input IS NULL AND input.hash = cache.input_hash
+                              LEFT JOIN blobs data ON cache.data IS NULL AND data.hash = cache.data_hash
+                              {where}
+                              ORDER BY cache.rowid''', parameters)
+    read = exported = 0
+    while batch := rows.fetchmany(_BATCH_SIZE):
+        pack.execute("BEGIN IMMEDIATE")
+        for module, name, config_hash, config, input_hash, input, data, data_hash, timestamp in batch:
+            read += 1
+            if data is None:
+                continue
+            data = serialize(json.loads(data))
+            data_hash = data_hash or sha256(data)
+            exists = pack.execute('''SELECT 1 FROM cache WHERE module = ? AND name = ? AND config_hash = ?
+                                     AND input_hash = ? AND data_hash = ?''',
+                                  (module, name, config_hash, input_hash, data_hash)).fetchone()
+            if exists:
+                continue
+            blobs = [(config_hash, config)]
+            if include_inputs:
+                blobs.append((input_hash, input))
+            if len(data) > blob_threshold:
+                blobs.append((data_hash, data))
+            pack.executemany("INSERT OR IGNORE INTO blobs(hash, content) VALUES (?, ?)",
+                             [blob for blob in blobs if blob[1] is not None])
+            pack.execute('''INSERT INTO cache(module, name, config_hash, input_hash, data, data_hash, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (module, name, config_hash, input_hash, data if len(data) <= blob_threshold else None,
+                          data_hash, timestamp))
+            exported += 1
+        pack.execute("COMMIT")
+    source.close()
+    return read, exported
+
+
+def _embedding_files(embedding_folder: str,
+                     namespaces: list[str] | None) -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+    """Returns the (path, member name) of every embedding file and of every memory-mapped embedding store folder,
+    optionally only of the given namespaces."""
+    files = []
+    stores = []
+    for directory, subdirectories, file_names in os.walk(embedding_folder):
+        if MemoryMappedEmbeddingStore.is_store(directory):
+            subdirectories.clear()
+            key = os.path.relpath(directory, embedding_folder).replace(os.sep, "/")
+            if not namespaces or any(key.startswith(namespace) for namespace in namespaces):
+                stores.append((directory, EMBEDDINGS + key + "/"))
+            continue
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            key = os.path.relpath(path, embedding_folder).replace(os.sep, "/")
+            if namespaces and not any(key.startswith(namespace) for namespace in namespaces):
+                continue
+            files.append((path, EMBEDDINGS + key))
+    return files, stores
+
+
+def _merge_store(target: MemoryMappedEmbeddingStore, source_path: str) -> int:
+    """Appends the embeddings of the store at source_path that target does not contain. Returns their number."""
+    source = MemoryMappedEmbeddingStore(source_path)
+    keys = [key for key in source.keys() if key not in target]
+    target.put_many(keys, [vector for vector in source.get_many(keys)])
+    return len(keys)
+
+
+def export_pack(pack_path: str, databases: list[str], embedding_folders: list[str] = (),
+                modules: list[str] | None = None, names: list[str] | None = None,
+                config_hashes: list[str] | None = None, embedding_namespaces: list[str] | None = None,
+                include_inputs: bool = False, blob_threshold: int = 1024) -> dict:
+    """Writes the cache rows of all databases and the embedding files of all folders into a single pack.
+    Rows can be restricted to module types, module names and configuration hashes.
+    Rows and files contained in several datasets are stored once.
+    Inputs are only needed to inspect a cache, so they are left out unless include_inputs is set.
+    Returns the manifest of the pack."""
+    where, parameters = _row_filter(modules, names, config_hashes)
+    with tempfile.TemporaryDirectory() as directory:
+        pack_database = os.path.join(directory, DATABASE)
+        pack = _connect(pack_database)
+        sources = []
+        for database_path in databases:
+            read, exported = _export_database(pack, database_path, where, parameters, blob_threshold, include_inputs)
+            sources.append({"database": os.path.abspath(database_path), "rows": read, "exported": exported})
+            print(f"Exported {exported} of {read} rows from {database_path}")
+        rows = pack.execute("SELECT count(*) FROM cache").fetchone()[0]
+        blobs = pack.execute("SELECT count(*) FROM blobs").fetchone()[0]
+        pack.execute("VACUUM")
+        pack.close()
+
+        embedding_files = {}
+        embedding_stores = {}
+        embeddings = 0
+        for embedding_folder in embedding_folders:
+            files, stores = _embedding_files(embedding_folder, embedding_namespaces)
+            for path, member in files:
+                # Equal keys hold equal embeddings, so the first file of a key is kept
+                embedding_files.setdefault(member, path)
+            for path, member in stores:
+                # Stores of the same namespace in several datasets are merged into one
+                if member not in embedding_stores:
+                    dtype = MemoryMappedEmbeddingStore(path).dtype.name
+                    embedding_stores[member] = MemoryMappedEmbeddingStore(os.path.join(directory, member), dtype)
+                embeddings += _merge_store(embedding_stores[member], path)
+        embeddings += len(embedding_files)
+        for member in embedding_stores:
+            for file_name in (MemoryMappedEmbeddingStore.METADATA, MemoryMappedEmbeddingStore.KEYS,
+                              MemoryMappedEmbeddingStore.VECTORS, MemoryMappedEmbeddingStore.SCALES):
+                if os.path.exists(os.path.join(directory, member, file_name)):
+                    embedding_files[member + file_name] = os.path.join(directory, member, file_name)
+
+        members = {DATABASE: pack_database, **embedding_files}
+        checksums = {}
+        for member, path in members.items():
+            with open(path, "rb") as file:
+                checksums[member] = _file_hash(file)
+        manifest = {
+            "format": PACK_FORMAT,
+            "version": PACK_VERSION,
+            "schema_version": SCHEMA_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "filters": {"modules": modules, "names": names, "config_hashes": config_hashes,
+                        "embedding_namespaces": embedding_namespaces, "include_inputs": include_inputs},
+            "sources": sources,
+            "counts": {"rows": rows, "blobs": blobs, "embeddings": embeddings},
+            "sha256": checksums,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(pack_path)), exist_ok=True)
+        with zipfile.ZipFile(pack_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(MANIFEST, json.dumps(manifest, indent=2))
+            for member, path in members.items():
+                archive.write(path, member)
+    return manifest
+
+
+def read_manifest(pack_path: str) -> dict:
+    with zipfile.ZipFile(pack_path) as archive:
+        manifest = json.loads(archive.read(MANIFEST))
+    if manifest.get("format") != PACK_FORMAT:
+        raise ValueError(f"{pack_path} is not a cache pack")
+    if manifest["version"] > PACK_VERSION:
+        raise ValueError(f"Cache pack {pack_path} has version {manifest['version']}, "
+                         f"but this version only supports up to {PACK_VERSION}")
+    return manifest
+
+
+def verify_pack(pack_path: str) -> dict:
+    """Checks that the pack contains exactly the members of its manifest with their recorded hashes.
+    Returns the manifest."""
+    manifest = read_manifest(pack_path)
+    with zipfile.ZipFile(pack_path) as archive:
+        members = set(archive.namelist()) - {MANIFEST}
+        if members != set(manifest["sha256"]):
+            raise ValueError(f"Cache pack {pack_path} does not match its manifest")
+        for member, checksum in manifest["sha256"].items():
+            with archive.open(member) as file:
+                if _file_hash(file) != checksum:
+                    raise ValueError(f"Cache pack {pack_path} is corrupted: checksum of {member} does not match")
+    return manifest
+
+
+def import_pack(pack_path: str, database_path: str, embedding_folder: str | None = None) -> dict:
+    """Merges a verified pack into a cache database and copies its embeddings into embedding_folder.
+    Rows and files that already exist are kept. Returns the number of imported rows, blobs and embeddings."""
+    verify_pack(pack_path)
+    imported = {"rows": 0, "blobs": 0, "embeddings": 0}
+    with zipfile.ZipFile(pack_path) as archive, tempfile.TemporaryDirectory() as directory:
+        if embedding_folder is not None:
+            # Packs with members outside of the embedding folder are rejected before anything is imported
+            for member in archive.namelist():
+                if member.startswith(EMBEDDINGS) and not member.endswith("/"):
+                    _member_path(embedding_folder, member.removeprefix(EMBEDDINGS))
+        pack_database = archive.extract(DATABASE, directory)
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        connection = sqlite3.connect(database_path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        register_functions(connection)
+        migrate(connection)
+        connection.execute("ATTACH DATABASE ? AS pack", (pack_database,))
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            imported["blobs"] = connection.execute('''INSERT OR IGNORE INTO main.blobs(hash, content)
+                                                      SELECT hash, content FROM pack.blobs''').rowcount
+            # Rows written before data_hash existed are compared by the hash of their data
+            imported["rows"] = connection.execute('''
+                INSERT INTO main.cache(module, name, config_hash, input_hash, data, data_hash, timestamp)
+                SELECT module, name, config_hash, input_hash, data, data_hash, timestamp FROM pack.cache packed
+                WHERE NOT EXISTS (SELECT 1 FROM main.cache existing
+                                  WHERE existing.module = packed.module AND existing.name = packed.name
+                                  AND existing.config_hash = packed.config_hash
+                                  AND existing.input_hash = packed.input_hash
+                                  AND COALESCE(existing.data_hash, canonical_hash(existing.data)) = packed.data_hash)
+                ORDER BY packed.rowid''').rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("DETACH DATABASE pack")
+        connection.close()
+
+        if embedding_folder is not None:
+            store_members = [member.removesuffix(MemoryMappedEmbeddingStore.METADATA)
+                             for member in archive.namelist()
+                             if member.startswith(EMBEDDINGS)
+                             and member.endswith("/" + MemoryMappedEmbeddingStore.METADATA)]
+            for store_member in store_members:
+                for member in archive.namelist():
+                    if member.startswith(store_member):
+                        archive.extract(member, directory)
+                source_path = _member_path(directory, store_member)
+                target = MemoryMappedEmbeddingStore(
+                    _member_path(embedding_folder, store_member.removeprefix(EMBEDDINGS)),
+                    MemoryMappedEmbeddingStore(source_path).dtype.name)
+                imported["embeddings"] += _merge_store(target, source_path)
+
+            for member in archive.namelist():
+                if not member.startswith(EMBEDDINGS) or member.endswith("/"):
+                    continue
+                if any(member.startswith(store_member) for store_member in store_members):
+                    continue
+                path = _member_path(embedding_folder, member.removeprefix(EMBEDDINGS))
+                if os.path.exists(path):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with archive.open(member) as source, open(path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                imported["embeddings"] += 1
+    print(f"Imported {imported['rows']} rows, {imported['blobs']} blobs and {imported['embeddings']} embeddings "
+          f"from {pack_path}")
+    return imported
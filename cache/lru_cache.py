@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """A bounded in-memory cache evicting the least recently used entries.
+    Entries are limited by count and, if max_bytes is given, by their estimated size in bytes.
+    All operations are thread-safe."""
+    __entries: OrderedDict[Hashable, tuple[Any, int]]
+    __max_entries: int
+    __max_bytes: int | None
+    __bytes: int
+    __lock: threading.RLock
+
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, max_entries: int, max_bytes: int | None = None):
+        self.__entries = OrderedDict()
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__bytes = 0
+        self.__lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.__lock:
+            return key in self.__entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable) -> tuple[Any, int] | None:
+        """Returns the value and size of an entry without counting a hit or changing its recency."""
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def put(self, key: Hashable, value: Any, size: int = 0):
+        """Adds or replaces an entry. Values larger than the byte limit are not cached."""
+        with self.__lock:
+            self.discard(key)
+            if (self.__max_bytes is not None and size > self.__max_bytes) or self.__max_entries <= 0:
+                return
+            self.__entries[key] = (value, size)
+            self.__bytes += size
+            while len(self.__entries) > self.__max_entries or (self.__max_bytes is not None
+                                                                 and self.__bytes > self.__max_bytes):
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__bytes -= evicted_size
+                self.evictions += 1
+
+    def discard(self, key: Hashable):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__bytes -= entry[1]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def statistics(self) -> dict[str, int]:
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,112 @@
+"""Maintenance commands for cache databases.
+
+Usage (from the repository root):
+    python -m cache.maintenance compact ./storage/sad_sam_code/teastore/cache.sqlite3
+    python -m cache.maintenance evict --max-size 2G --ttl classifier=30d --ttl *=90d ./storage/*/cache.sqlite3
+    python -m cache.maintenance export cache-pack.zip --module classifier --embeddings ./storage/*/embeddings \
+        ./storage/*/cache.sqlite3
+    python -m cache.maintenance import cache-pack.zip --embeddings ./storage/teastore/embeddings \
+        ./storage/teastore/cache.sqlite3
+"""
+import argparse
+import os
+import re
+from datetime import timedelta
+
+from cache.cache_manager import CacheManager
+from cache.cache_pack import export_pack, import_pack
+
+
+def open_cache(database_path: str) -> CacheManager:
+    folder_path, file_name = os.path.split(os.path.abspath(database_path))
+    database_name = file_name.removesuffix(".sqlite3")
+    return CacheManager.open(database_name=database_name, folder_path=folder_path)
+
+
+def compact(database_path: str):
+    size_before = os.path.getsize(database_path)
+    open_cache(database_path).compact()
+    size_after = os.path.getsize(database_path)
+    print(f"Compacted {database_path}: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+
+
+def parse_size(size: str) -> int:
+    """Parses sizes like 512M or 2G into bytes."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMGT]?)i?B?", size.strip(), re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {size}")
+    exponent = " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * 1024 ** exponent)
+
+
+def parse_time_to_live(time_to_live: str) -> tuple[str, timedelta]:
+    """Parses module=duration pairs like classifier=30d. Durations are given in s, m, h or d."""
+    match = re.fullmatch(r"([^=]+)=(\d+)([smhd])", time_to_live.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid time to live: {time_to_live}")
+    unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}[match.group(3)]
+    return match.group(1), timedelta(**{unit: int(match.group(2))})
+
+
+def evict(database_path: str, max_bytes: int | None, time_to_live: dict[str, timedelta]):
+    size_before = os.path.getsize(database_path)
+    summary = open_cache(database_path).evict(max_bytes=max_bytes, time_to_live=time_to_live)
+    size_after = os.path.getsize(database_path)
+    print(f"Evicted from {database_path}: {summary}, {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+
+
+def main(arguments: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m cache.maintenance", description="Maintains cache databases.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = commands.add_parser("compact", help="move stored inputs and large data into content-addressed "
+                                                         "blobs and shrink the database file")
+    compact_parser.add_argument("databases", nargs="+", help="paths of cache .sqlite3 files")
+
+    evict_parser = commands.add_parser("evict", help="collapse duplicate rows, delete expired and oldest rows "
+                                                     "and vacuum the database file")
+    evict_parser.add_argument("--max-size", type=parse_size, default=None,
+                              help="maximum size of the stored data, e.g. 2G")
+    evict_parser.add_argument("--ttl", type=parse_time_to_live, action="append", default=[],
+                              help="time to live per module type, e.g. classifier=30d. "
+                                   f"'{CacheManager.ALL_MODULES}' matches all other module types")
+    evict_parser.add_argument("databases", nargs="+", help="paths of cache .sqlite3 files")
+
+    export_parser = commands.add_parser("export", help="write the cache rows and embeddings of several datasets "
+                                                       "into a single deduplicated cache pack")
+    export_parser.add_argument("pack", help="path of the cache pack .zip file to write")
+    export_parser.add_argument("--module", action="append", default=None, help="only export rows of this module type")
+    export_parser.add_argument("--name", action="append", default=None, help="only export rows of this module name")
+    export_parser.add_argument("--config-hash", action="append", default=None,
+                               help="only export rows of this configuration hash")
+    export_parser.add_argument("--embeddings", action="append", default=[],
+                               help="embedding folder whose files are exported")
+    export_parser.add_argument("--namespace", action="append", default=None,
+                               help="only export embeddings of this namespace")
+    export_parser.add_argument("--include-inputs", action="store_true",
+                               help="also export the inputs the rows were created from")
+    export_parser.add_argument("databases", nargs="+", help="paths of cache .sqlite3 files")
+
+    import_parser = commands.add_parser("import", help="verify a cache pack and merge it into a cache database")
+    import_parser.add_argument("pack", help="path of the cache pack .zip file")
+    import_parser.add_argument("--embeddings", default=None, help="embedding folder the embeddings are copied into")
+    import_parser.add_argument("database", help="path of the cache .sqlite3 file")
+
+    args = parser.parse_args(arguments)
+    if args.command == "compact":
+        for database in args.databases:
+            compact(database)
+    elif args.command == "evict":
+        for database in args.databases:
+            evict(database, args.max_size, dict(args.ttl))
+    elif args.command == "export":
+        manifest = export_pack(args.pack, args.databases, args.embeddings, modules=args.module, names=args.name,
+                               config_hashes=args.config_hash, embedding_namespaces=args.namespace,
+                               include_inputs=args.include_inputs)
+        print(f"Wrote {args.pack}: {manifest['counts']}, {os.path.getsize(args.pack) / 2**20:.1f} MiB")
+    elif args.command == "import":
+        import_pack(args.pack, args.database, args.embeddings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+
+# Each entry migrates a cache database from the version of its index to the next version.
+# The current version of a database file is stored in its user_version pragma.
+MIGRATIONS: list[list[str]] = [
+    # 0 -> 1: Index the lookup key. Databases created before versioning already contain the table.
+    [
+        '''CREATE TABLE IF NOT EXISTS cache(
+                module TEXT,
+                name TEXT,
+                config_hash TEXT,
+                config TEXT,
+                input_hash TEXT,
+                input TEXT,
+                data JSON,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+        '''CREATE INDEX IF NOT EXISTS cache_key ON cache(module, name, config_hash, input_hash)''',
+    ],
+    # 1 -> 2: Content-addressed blobs. Inputs, configurations and large data are stored once and referenced by hash.
+    # Rows written before keep their inline columns until the database is compacted.
+    [
+        '''CREATE TABLE IF NOT EXISTS blobs(
+                hash TEXT PRIMARY KEY,
+                content TEXT)''',
+        '''ALTER TABLE cache ADD COLUMN data_hash TEXT''',
+    ],
+    # 2 -> 3: Eviction by age
+    [
+        '''CREATE INDEX IF NOT EXISTS cache_timestamp ON cache(timestamp)''',
+    ],
+    # 3 -> 4: Hash the data of rows written before data_hash existed, so they are recognized when it is put again.
+    # canonical_hash is registered by register_functions
+    [
+        '''UPDATE cache SET data_hash = canonical_hash(data) WHERE data_hash IS NULL AND data IS NOT NULL''',
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection: sqlite3.Connection):
+    """Brings the cache database behind the connection up to SCHEMA_VERSION.
+    Every migration step runs in its own transaction. The connection must not be in a transaction already."""
+    version = schema_version(connection)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Cache database has schema version {version}, "
+                         f"but this version only supports up to {SCHEMA_VERSION}")
+
+    existing = connection.execute("SELECT count(*) FROM sqlite_master WHERE type='table' AND name='cache'").fetchone()[0]
+    for target_version in range(version + 1, SCHEMA_VERSION + 1):
+        if existing:
+            print(f"Migrating cache database to schema version {target_version}")
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process might have migrated the database in the meantime
+            if schema_version(connection) < target_version:
+                for statement in MIGRATIONS[target_version - 1]:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {target_version}")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+def serialize(data: dict) -> str:
+    """The json representation data is stored and hashed with."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def sha256(data: str) -> str:
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def canonical_hash(serialized: str) -> str:
+    """Hashes json independent of the whitespace it was written with."""
+    return sha256(serialize(json.loads(serialized)))
+
+
+def register_functions(connection: sqlite3.Connection):
+    """Makes canonical_hash available in SQL statements of the connection."""
+    connection.create_function("canonical_hash", 1, canonical_hash, deterministic=True)
@@ -1,19 +1,75 @@
 import itertools
 import json
+import pickle
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
+from typing import BinaryIO, Iterator, TypeVar
 
 from pipeline_modules.artifact_providers.artifact_provider import ArtifactProvider, ArtifactProviderBuilder
 from pipeline_modules.classifier.classifier import Classifier, ClassifierBuilder
+from pipeline_modules.classifier.classification_scheduler import ClassificationScheduler
 from pipeline_modules.classifier.context_provider import ContextProvider
 from pipeline_modules.element_store.element_store import ElementStore, ElementStoreBuilder, EmbeddedElement
+from pipeline_modules.embedding_creator.deduplicating_embedding_creator import DeduplicatingEmbeddingCreator
 from pipeline_modules.embedding_creator.embedding_creator import EmbeddingCreator, EmbeddingCreatorBuilder
+from pipeline_modules.knowledge import Artifact, Element
 from pipeline_modules.module import PipelineConfiguration, ModuleConfiguration
 from pipeline_modules.preprocessors.preprocessor import Preprocessor, PreprocessorBuilder
 from pipeline_modules.result_aggregator.result_aggregator import ResultAggregator, ResultAggregatorBuilder
 from pipeline_modules.result_aggregator.result_aggregator import TraceLink
 
+T = TypeVar("T")
+
+
+def prefetch(iterator: Iterator[T], size: int) -> Iterator[T]:
+    """Iterates over iterator in a background thread, which runs at most size items ahead of the consumer.
+    Exceptions of the iterator are raised in the consumer."""
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        # Waits for free space, unless the consumer stopped iterating
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as exception:
+            put((end, exception))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exception = items.get()
+            if exception is not None:
+                raise exception
+            if item is end:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
 
 class Controller:
+    # Number of source elements whose target candidates are retrieved with one store call
+    __RETRIEVAL_BATCH_SIZE = 1000
+
     source_preprocessor_config: ModuleConfiguration
     target_preprocessor_config: ModuleConfiguration
     embedding_config: ModuleConfiguration
@@ -27,13 +83,31 @@ class Controller:
     target_store: ElementStore
     context_provider: ContextProvider
     classifier: Classifier
+    classification_scheduler: ClassificationScheduler
     result_aggregator: ResultAggregator
 
+    __concurrent_ingestion: bool
+    __ingestion_batch_size: int | None
+    __ingestion_prefetch: int
+    __preprocessing_processes: int
+    __preprocessing_chunk_size: int
+
     def __init__(self, pipeline_configuration: PipelineConfiguration):
         # Special handling for preprocessors and embedding to provide hash for later modules.
         self.source_preprocessor_config = pipeline_configuration.source_preprocessor
         self.target_preprocessor_config = pipeline_configuration.target_preprocessor
         self.embedding_config = pipeline_configuration.embedding_creator
+        # Runs the ingestion of source and target artifacts in parallel threads. Embedding creators requiring a fit
+        # are fitted on the target elements before, so the embeddings do not depend on which side is embedded first
+        self.__concurrent_ingestion = pipeline_configuration.controller.get("concurrent_ingestion", False)
+        # Elements embedded and written to the store at once, all elements by default
+        self.__ingestion_batch_size = pipeline_configuration.controller.get("ingestion_batch_size")
+        # Batches embedded in a background thread while the store writes the previous ones
+        self.__ingestion_prefetch = pipeline_configuration.controller.get("ingestion_prefetch", 0)
+        # Artifacts are preprocessed by a pool of processes if more than one, in this process otherwise
+        self.__preprocessing_processes = pipeline_configuration.controller.get("preprocessing_processes", 0)
+        # Artifacts sent to a preprocessing process at once
+        self.__preprocessing_chunk_size = pipeline_configuration.controller.get("preprocessing_chunk_size", 16)
 
         self.source_artifact_provider = ArtifactProviderBuilder().build_artifact_provider(
             configuration=pipeline_configuration.source_artifact_provider)
@@ -47,6 +121,12 @@ class Controller:
 
         self.embedding_creator = EmbeddingCreatorBuilder().build_embedding_creator(
             configuration=pipeline_configuration.embedding_creator)
+        # Elements with equal contents share their embedding, also between source and target,
+        # for the embedding_deduplication_size most recently embedded contents
+        if pipeline_configuration.controller.get("embedding_deduplication", False):
+            self.embedding_creator = DeduplicatingEmbeddingCreator(
+                self.embedding_creator,
+                max_entries=pipeline_configuration.controller.get("embedding_deduplication_size", 100000))
 
         self.source_store = ElementStoreBuilder().build_element_store(
             configuration=pipeline_configuration.source_store)
@@ -56,6 +136,10 @@ class Controller:
         self.context_provider = ContextProvider(self.source_store, self.target_store)
         self.classifier = ClassifierBuilder().build_classifier(
             configuration=pipeline_configuration.classifier, context_provider=self.context_provider)
+        # Classifier arguments are part of the cache keys, so the scheduling options are controller options
+        self.classification_scheduler = ClassificationScheduler(
+            max_concurrency=pipeline_configuration.controller.get("classification_concurrency", 8),
+            rate_limits=pipeline_configuration.controller.get("classification_rate_limits"))
 
         self.result_aggregator = ResultAggregatorBuilder().build_result_aggregator(
             configuration=pipeline_configuration.result_aggregator)
@@ -67,50 +151,164 @@ class Controller:
                                sort_keys=True).encode())
         return hash.hexdigest()
 
+    def __preprocessed(self, is_source: bool, timings: dict[str, float]) -> Iterator[list[Element]]:
+        """Reads and preprocesses the artifacts of one side lazily and yields the elements of every artifact.
+        The seconds spent are added to timings."""
+        artifact_provider = self.source_artifact_provider if is_source else self.target_artifact_provider
+        preprocessor = self.source_preprocessor if is_source else self.target_preprocessor
+
+        def artifacts() -> Iterator[Artifact]:
+            iterator = artifact_provider.iter_artifacts()
+            while True:
+                start = time.perf_counter()
+                artifact = next(iterator, None)
+                timings["artifact provider"] += time.perf_counter() - start
+                if artifact is None:
+                    return
+                yield artifact
+
+        if self.__preprocessing_processes > 1:
+            preprocessed = preprocessor.preprocess_parallel(artifacts(), self.__preprocessing_processes,
+                                                            self.__preprocessing_chunk_size)
+        else:
+            preprocessed = map(preprocessor.preprocess, artifacts())
+        while True:
+            start = time.perf_counter()
+            provider_start = timings["artifact provider"]
+            artifact_elements = next(preprocessed, None)
+            # Artifacts read while preprocessing are timed by artifacts()
+            timings["preprocessor"] += (time.perf_counter() - start
+                                        - (timings["artifact provider"] - provider_start))
+            if artifact_elements is None:
+                return
+            yield artifact_elements
+
+    def __elements(self, is_source: bool, timings: dict[str, float],
+                   spool: BinaryIO | None = None) -> Iterator[Element]:
+        """Yields the elements of one side, read back from spool if the side was preprocessed before."""
+        if spool is None:
+            for artifact_elements in self.__preprocessed(is_source, timings):
+                yield from artifact_elements
+            return
+        while True:
+            start = time.perf_counter()
+            try:
+                # Elements are pickled per artifact, which keeps their parent links
+                artifact_elements = pickle.load(spool)
+            except EOFError:
+                return
+            finally:
+                timings["preprocessor"] += time.perf_counter() - start
+            yield from artifact_elements
+
+    def __fit_embedding_creator(self) -> BinaryIO:
+        """Fits the embedding creator on all target elements before any side is ingested,
+        so the embeddings neither depend on the ingestion batches nor on which side is embedded first.
+        The elements are streamed into the creator and spooled to a temporary file, which the target ingestion
+        reads instead of reading and preprocessing the artifacts again. Returns the spool."""
+        start = time.perf_counter()
+        timings = dict.fromkeys(["artifact provider", "preprocessor"], 0.0)
+        spool = tempfile.TemporaryFile()
+
+        def spooled() -> Iterator[Element]:
+            for artifact_elements in self.__preprocessed(False, timings):
+                pickle.dump(artifact_elements, spool, protocol=pickle.HIGHEST_PROTOCOL)
+                yield from artifact_elements
+
+        try:
+            self.embedding_creator.fit(spooled())
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        print(f"Fitting the embedding creator took {time.perf_counter() - start:.2f} s ("
+              + ", ".join(f"{module} {seconds:.2f} s" for module, seconds in timings.items()) + ")")
+        return spool
+
+    def __ingest(self, is_source: bool, spool: BinaryIO | None = None) -> dict[str, float]:
+        """Runs artifact provider, preprocessor, embedding creator and element store of one side.
+        Artifacts are read, preprocessed and embedded lazily in batches of ingestion_batch_size elements,
+        which the store writes before the next batch is created, so only a few batches are in memory at once.
+        The embedding creator is fitted on all target elements before, so the batches get the same embeddings
+        as a single batch. With spool, the elements are read from the spool of __fit_embedding_creator.
+        Returns the seconds spent in every module."""
+        side = "Source" if is_source else "Target"
+        store = self.source_store if is_source else self.target_store
+        timings = dict.fromkeys(["artifact provider", "preprocessor", "embedding creator", "element store"], 0.0)
+
+        def batches() -> Iterator[list[EmbeddedElement]]:
+            elements_iterator = self.__elements(is_source, timings, spool)
+            while batch := list(itertools.islice(elements_iterator, self.__ingestion_batch_size)):
+                start = time.perf_counter()
+                embeddings = self.embedding_creator.calculate_multiple_embeddings(elements=batch)
+                timings["embedding creator"] += time.perf_counter() - start
+                yield [EmbeddedElement(element=element, embedding=embedding)
+                       for element, embedding in zip(batch, embeddings)]
+
+        def waited(iterator: Iterator[list[EmbeddedElement]]) -> Iterator[list[EmbeddedElement]]:
+            # Time the store waits for batches is not spent in the store
+            while True:
+                start = time.perf_counter()
+                batch = next(iterator, None)
+                timings["element store"] -= time.perf_counter() - start
+                if batch is None:
+                    return
+                yield batch
+
+        print(f"{side} Ingestion")
+        start = time.perf_counter()
+        embedded_batches = batches()
+        if self.__ingestion_prefetch > 0:
+            embedded_batches = prefetch(embedded_batches, self.__ingestion_prefetch)
+        store.create_vector_store_from_batches(previous_modules_key=self.__preprocessor_embedding_key(is_source),
+                                               batches=waited(embedded_batches))
+        timings["element store"] += time.perf_counter() - start
+
+        print(f"{side} ingestion took {time.perf_counter() - start:.2f} s ("
+              + ", ".join(f"{module} {seconds:.2f} s" for module, seconds in timings.items()) + ")")
+        return timings
+
+    def close(self):
+        """Releases the element stores once the links of the run are aggregated."""
+        self.source_store.close()
+        self.target_store.close()
+
     def run(self) -> list[TraceLink]:  # TODO: refactor into smaller functions
         print("Controller running...")
 
-        # Preprocess target artifacts
-        print("Target Artifact Provider")
-        target_artifacts = self.target_artifact_provider.get_all_artifacts()
-        print("Target Preprocessor")
-        target_elements = list(itertools.chain.from_iterable(map(self.target_preprocessor.preprocess, target_artifacts)))
-
-        print("Target Embedding Creator")
-        target_embeddings: list[EmbeddedElement] = [
-            EmbeddedElement(element=element, embedding=embedding)
-            for element, embedding
-            in zip(target_elements, self.embedding_creator.calculate_multiple_embeddings(elements=target_elements))
-        ]
-
-        print("Target Element Store")
-        self.target_store.create_vector_store(previous_modules_key=self.__preprocessor_embedding_key(False),
-                                              entries=target_embeddings)
-
-        # Preprocess source artifacts  # TODO: same as target artifacts -> refactor
-        print("Source Artifact Provider")
-        source_artifacts = self.source_artifact_provider.get_all_artifacts()
-        print("Source Preprocessor")
-        source_elements = list(
-            itertools.chain.from_iterable(map(self.source_preprocessor.preprocess, source_artifacts)))
-        print("Source Embedding Creator")
-        source_embeddings: list[EmbeddedElement] = [
-            EmbeddedElement(element=element, embedding=embedding)
-            for element, embedding
-            in zip(source_elements, self.embedding_creator.calculate_multiple_embeddings(elements=source_elements))
-        ]
-        print("Source Element Store")
-        self.source_store.create_vector_store(previous_modules_key=self.__preprocessor_embedding_key(True),
-                                              entries=source_embeddings)
+        start = time.perf_counter()
+        spool = self.__fit_embedding_creator() if self.embedding_creator.requires_fit() else None
+        try:
+            if self.__concurrent_ingestion:
+                # Both sides are independent until classification, the slower side determines the duration
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    target = executor.submit(self.__ingest, False, spool)
+                    source = executor.submit(self.__ingest, True)
+                    target.result()
+                    source.result()
+            else:
+                self.__ingest(False, spool)
+                self.__ingest(True)
+        finally:
+            if spool is not None:
+                spool.close()
+        print(f"Ingestion took {time.perf_counter() - start:.2f} s")
+        # The sibling indices of the context provider are built from the new stores on first use
+        self.context_provider.reset()
 
         # Classification
         print("Classifier")
-        classification_results = []
-        for query in self.source_store.get_all_elements(compare=True):
-            target_candidates = self.target_store.find_similar(query=query.embedding)
-            print(f"{query.element.identifier} : {target_candidates}")
+        classification_queries = []
+        queries = self.source_store.get_all_elements(compare=True)
+        for start in range(0, len(queries), self.__RETRIEVAL_BATCH_SIZE):
+            batch = queries[start:start + self.__RETRIEVAL_BATCH_SIZE]
+            batch_candidates = self.target_store.find_similar_many(queries=[query.embedding for query in batch])
+            for query, target_candidates in zip(batch, batch_candidates):
+                print(f"{query.element.identifier} : {target_candidates}")
 
-            classification_results.append(self.classifier.classify(query.element, target_candidates))
+                classification_queries.append((query.element, target_candidates))
+        # The LLM calls of all queries are scheduled together
+        classification_results = self.classifier.classify_all(classification_queries, self.classification_scheduler)
 
         print("Result Aggregator")
         trace_links = self.result_aggregator.aggregate(classification_results)
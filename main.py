@@ -40,6 +40,7 @@ def load_config(path: str):
     config.source_artifact_provider = __load_module_config("source_artifact_provider", arguments)
     config.target_preprocessor = __load_module_config("target_preprocessor", arguments)
     config.source_preprocessor = __load_module_config("source_preprocessor", arguments)
+    config.controller = arguments.get("controller", {})
 
     return config
 
@@ -90,9 +91,10 @@ if __name__ == '__main__':
         pipeline_config.source_store.args["path"] = tuple[3]
         pipeline_config.target_store.args["path"] = tuple[4]
 
-        CacheManager(database_name="cache", folder_path=pipeline_config.target_store.args["path"])
+        CacheManager.open(database_name="cache", folder_path=pipeline_config.target_store.args["path"])
         controller = Controller(pipeline_configuration=pipeline_config)
         links = controller.run()
+        controller.close()
 
         print(f"RESULTS: {tuple[6]}")
         results.append(calculate_f1([(link.source, link.target) for link in links], tuple[5], False, False))
@@ -112,9 +114,10 @@ if __name__ == '__main__':
             pipeline_config.target_store = pipeline_config.source_store
             pipeline_config.source_store = new_source_store
 
-            CacheManager(database_name="cache", folder_path=pipeline_config.target_store.args["path"])
+            CacheManager.open(database_name="cache", folder_path=pipeline_config.target_store.args["path"])
             controller = Controller(pipeline_configuration=pipeline_config)
             links = controller.run()
+            controller.close()
 
             print(f"RESULTS: {tuple[6]}-reversed")
             reversed_results.append(calculate_f1([(link.source, link.target) for link in links], tuple[5], False, True))
@@ -1,3 +1,4 @@
+from typing import Iterator
 from typing import Protocol
 
 from ..knowledge import Artifact
@@ -9,6 +10,11 @@ class ArtifactProvider(Protocol):
     def get_all_artifacts(self) -> list[Artifact]:
         ...
 
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        """Yields the artifacts one after another. Providers read an artifact only when it is requested,
+        so the artifacts do not have to fit into memory at once."""
+        ...
+
     def get_artifact(self, identifier: str) -> Artifact:
         ...
 
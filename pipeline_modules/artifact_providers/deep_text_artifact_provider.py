@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Iterator
 
 from .artifact_provider import ArtifactProvider
 from ..knowledge import Artifact
@@ -8,9 +9,11 @@ from ..module import ModuleConfiguration
 class DeepTextArtifactProvider(ArtifactProvider):
     """Provides artifacts with their content being the texts from utf-8 encoded text files.
     Searches subdirectories for files.
-    Needs absolute file path to correctly assign identifiers."""
+    Needs absolute file path to correctly assign identifiers.
+    Files are read when the artifacts are requested."""
     __configuration: ModuleConfiguration
-    __artifacts: list[Artifact]
+    __artifacts: list[Artifact] | None
+    __file_paths: list[Path]
     __path: str
     __extensions: list[str]
     __type: str
@@ -21,18 +24,29 @@ class DeepTextArtifactProvider(ArtifactProvider):
         self.__extensions = self.__configuration.args["extensions"]
         self.__type = self.__configuration.args["artifact_type"]
 
-        self.__artifacts = list()
+        self.__artifacts = None
+        self.__file_paths = list()
         for extension in self.__extensions:
-            for file_path in Path(self.__path).rglob("*" + extension):
-                print(file_path)
-                file = open(file_path, 'r', encoding="utf-8")
-                content = file.read()
-                identifier = file_path.as_posix().removeprefix(self.__path).removeprefix("/")
-                artifact = Artifact(identifier=identifier, type=self.__type, content=content)
-                self.__artifacts.append(artifact)
+            self.__file_paths.extend(Path(self.__path).rglob("*" + extension))
+
+    def __read(self, file_path: Path) -> Artifact:
+        print(file_path)
+        with open(file_path, 'r', encoding="utf-8") as file:
+            content = file.read()
+        identifier = file_path.as_posix().removeprefix(self.__path).removeprefix("/")
+        return Artifact(identifier=identifier, type=self.__type, content=content)
 
     def get_all_artifacts(self) -> list[Artifact]:
+        if self.__artifacts is None:
+            self.__artifacts = list(self.iter_artifacts())
         return self.__artifacts
 
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        if self.__artifacts is not None:
+            yield from self.__artifacts
+            return
+        for file_path in self.__file_paths:
+            yield self.__read(file_path)
+
     def get_artifact(self, identifier: str) -> Artifact:
-        return [artifact for artifact in self.__artifacts if artifact.identifier == identifier][0]
+        return [artifact for artifact in self.get_all_artifacts() if artifact.identifier == identifier][0]
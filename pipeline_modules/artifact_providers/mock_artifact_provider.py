@@ -1,3 +1,5 @@
+from typing import Iterator
+
 from .artifact_provider import ArtifactProvider
 from ..knowledge import Artifact
 from ..module import ModuleConfiguration
@@ -15,5 +17,8 @@ class MockArtifactProvider(ArtifactProvider):
     def get_all_artifacts(self) -> list[Artifact]:
         return self.artifacts
 
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        yield from self.artifacts
+
     def get_artifact(self, identifier: str) -> Artifact:
         return [artifact for artifact in self.artifacts if artifact.identifier == identifier][0]
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Iterator
 
 from .artifact_provider import ArtifactProvider
 from ..knowledge import Artifact
@@ -27,5 +28,8 @@ class SingleFileArtifactProvider(ArtifactProvider):
     def get_all_artifacts(self) -> list[Artifact]:
         return self.__artifacts
 
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        yield from self.__artifacts
+
     def get_artifact(self, identifier: str) -> Artifact:
         return [artifact for artifact in self.__artifacts if artifact.identifier == identifier][0]
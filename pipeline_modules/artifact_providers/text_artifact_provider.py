@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Iterator
 
 from .artifact_provider import ArtifactProvider
 from ..knowledge import Artifact
@@ -6,26 +7,38 @@ from ..module import ModuleConfiguration
 
 
 class TextArtifactProvider(ArtifactProvider):
-    """Provides artifacts with their content being the texts from utf-8 encoded text files located in the same folder."""
+    """Provides artifacts with their content being the texts from utf-8 encoded text files located in the same folder.
+    Files are read when the artifacts are requested."""
     __configuration: ModuleConfiguration
-    __artifacts: list[Artifact]
+    __artifacts: list[Artifact] | None
+    __file_paths: list[Path]
     __path: str
 
     def __init__(self, configuration: ModuleConfiguration):
         self.__configuration = configuration
         self.__path = self.__configuration.args["path"]
 
-        self.__artifacts = list()
-        for file_path in Path(self.__path).iterdir():
-            print(file_path)
-            file = open(file_path, 'r', encoding="utf-8")
+        self.__artifacts = None
+        self.__file_paths = list(Path(self.__path).iterdir())
+
+    def __read(self, file_path: Path) -> Artifact:
+        print(file_path)
+        with open(file_path, 'r', encoding="utf-8") as file:
             content = file.read()
-            identifier = file_path.stem
-            artifact = Artifact(identifier=identifier, type=self.__configuration.args["artifact_type"], content=content)
-            self.__artifacts.append(artifact)
+        identifier = file_path.stem
+        return Artifact(identifier=identifier, type=self.__configuration.args["artifact_type"], content=content)
 
     def get_all_artifacts(self) -> list[Artifact]:
+        if self.__artifacts is None:
+            self.__artifacts = list(self.iter_artifacts())
         return self.__artifacts
 
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        if self.__artifacts is not None:
+            yield from self.__artifacts
+            return
+        for file_path in self.__file_paths:
+            yield self.__read(file_path)
+
     def get_artifact(self, identifier: str) -> Artifact:
-        return [artifact for artifact in self.__artifacts if artifact.identifier == identifier][0]
+        return [artifact for artifact in self.get_all_artifacts() if artifact.identifier == identifier][0]
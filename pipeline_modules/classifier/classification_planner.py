@@ -0,0 +1,58 @@
+from typing import Any, Callable, TypeVar
+
+from ..knowledge import Element
+
+T = TypeVar("T")
+
+
+class ClassificationPlanner:
+    """Plans the classification of the (source, target) pairs of many queries.
+
+    Queries are expected at the granularity the classifier prompts with (e.g. projected to their original artifacts).
+    Pairs are deduplicated by their identifiers and then by their cache input key, so every distinct prompt is looked
+    up and sent to the LLM only once. The values of the unique pairs are fanned out to the queries with fan_out."""
+    pairs: list[tuple[Element, Element]]
+    keys: list[str]
+    __queries: list[tuple[Element, list[Element]]]
+    __planned: int
+    # Position in pairs of every target of every query
+    __positions: list[int]
+
+    def __init__(self, queries: list[tuple[Element, list[Element]]], input_key: Callable[[Element, Element], str]):
+        self.__queries = queries
+        self.pairs = list()
+        self.keys = list()
+        self.__positions = list()
+        by_identifiers = dict()
+        by_key = dict()
+        for source, targets in queries:
+            for target in targets:
+                identifiers = (source.identifier, target.identifier)
+                position = by_identifiers.get(identifiers)
+                if position is None:
+                    key = input_key(source, target)
+                    position = by_key.get(key)
+                    if position is None:
+                        position = len(self.pairs)
+                        self.pairs.append((source, target))
+                        self.keys.append(key)
+                        by_key[key] = position
+                    by_identifiers[identifiers] = position
+                self.__positions.append(position)
+        self.__planned = len(self.__positions)
+
+    def misses(self, values: list[Any | None]) -> list[int]:
+        """Returns the positions of the unique pairs without (cached) value and reports the saved work."""
+        misses = [position for position, value in enumerate(values) if value is None]
+        print(f"Planned {self.__planned} pairs: {len(self.pairs)} unique, {len(self.pairs) - len(misses)} cached, "
+              f"{len(misses)} to classify")
+        return misses
+
+    def fan_out(self, values: list[T]) -> list[list[T]]:
+        """Returns the values of the targets of every query, given the values of the unique pairs."""
+        fanned_out = list()
+        start = 0
+        for _, targets in self.__queries:
+            fanned_out.append([values[position] for position in self.__positions[start:start + len(targets)]])
+            start += len(targets)
+        return fanned_out
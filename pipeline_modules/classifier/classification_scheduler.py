@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+
+from langchain_core.runnables import Runnable
+
+from ..token_bucket import TokenBucket
+
+
+class ClassificationScheduler:
+    """Runs the LLM calls of classifiers concurrently.
+
+    Classifiers gather the uncached calls of all their queries and hand them to run, which invokes them
+    on a thread pool of max_concurrency threads and yields the outputs in the order of the inputs.
+    rate_limits maps providers (e.g. "openai", "ollama") to their maximum number of requests per minute,
+    the limit of a provider is shared by all calls of all classifiers using this scheduler."""
+    __max_concurrency: int
+    __chunk_size: int
+    __rate_limits: dict[str, TokenBucket]
+
+    def __init__(self, max_concurrency: int = 8, rate_limits: dict[str, int] | None = None, chunk_size: int = 100):
+        self.__max_concurrency = max(1, max_concurrency)
+        self.__chunk_size = max(1, chunk_size)
+        self.__rate_limits = {provider: TokenBucket(requests_per_minute)
+                              for provider, requests_per_minute in (rate_limits or {}).items()}
+
+    def run(self, chain: Runnable, inputs: list[dict[str, Any]], provider: str) -> Iterator[tuple[int, list[str]]]:
+        """Yields the outputs of the chain for the inputs in chunks of chunk_size,
+        together with the position of the first input of the chunk.
+        All inputs are submitted at once, so the calls continue while the caller processes (e.g. caches) a chunk."""
+        if not inputs:
+            return
+        rate_limit = self.__rate_limits.get(provider)
+
+        def invoke(input: dict[str, Any]) -> str:
+            if rate_limit is not None:
+                rate_limit.acquire(1)
+            return chain.invoke(input)
+
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=min(self.__max_concurrency, len(inputs)))
+        try:
+            futures = [executor.submit(invoke, input) for input in inputs]
+            for chunk_start in range(0, len(futures), self.__chunk_size):
+                yield chunk_start, [future.result() for future in futures[chunk_start:chunk_start + self.__chunk_size]]
+        finally:
+            # Calls that have not started are dropped if the caller stops early or a call failed
+            executor.shutdown(wait=True, cancel_futures=True)
+        duration = time.perf_counter() - start
+        print(f"Classified {len(inputs)} inputs with {provider} in {duration:.2f} s "
+              f"({len(inputs) / duration if duration > 0 else 0:.1f}/s)")
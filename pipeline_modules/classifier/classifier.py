@@ -1,5 +1,6 @@
 from typing import Protocol
 
+from .classification_scheduler import ClassificationScheduler
 from .context_provider import ContextProvider
 from ..knowledge import Element
 from ..module import ModuleConfiguration
@@ -18,6 +19,12 @@ class Classifier(Protocol):
     def classify(self, source: Element, targets: list[Element]) -> ClassificationResult:
         ...
 
+    def classify_all(self, queries: list[tuple[Element, list[Element]]],
+                     scheduler: ClassificationScheduler) -> list[ClassificationResult]:
+        """Returns the result of classify for every (source, targets) query.
+        The uncached LLM calls of all queries are run together by the scheduler."""
+        ...
+
 
 class ClassifierBuilder:
     from .mock_classifier import MockClassifier
@@ -1,16 +1,65 @@
 import re
+import threading
 
 from pipeline_modules.element_store.element_store import ElementStore
 from pipeline_modules.knowledge import Element
 
 
+def natural_sort_key(identifier: str) -> list[int | str]:
+    # Simple natural sort, might break for edge cases
+    return [int(y) if y.isdigit() else y.lower() for y in re.split("(\\d+)", identifier)]
+
+
+class SiblingIndex:
+    """Naturally sorted children of every parent of a store, with the position of every child among its siblings."""
+    __siblings: dict[str, list[Element]]
+    __positions: dict[str, int]
+
+    def __init__(self, store: ElementStore):
+        self.__siblings = dict()
+        self.__positions = dict()
+        for entry in store.get_all_elements():
+            if entry.element.parent is not None:
+                self.__siblings.setdefault(entry.element.parent.identifier, []).append(entry.element)
+        for siblings in self.__siblings.values():
+            siblings.sort(key=lambda x: natural_sort_key(x.identifier))
+            for index, sibling in enumerate(siblings):
+                self.__positions[sibling.identifier] = index
+
+    def neighbours(self, element: Element, pre: int, post: int) -> (list[Element], list[Element]):
+        siblings = self.__siblings[element.parent.identifier]
+        index = self.__positions[element.identifier]
+        return siblings[max(index - pre, 0):index], siblings[index + 1:index + 1 + post]
+
+
 class ContextProvider:
     source_store: ElementStore
     target_store: ElementStore
 
+    __sibling_indices: dict[bool, SiblingIndex]
+    __lock: threading.Lock
+
     def __init__(self, source_store: ElementStore, target_store: ElementStore):
         self.source_store = source_store
         self.target_store = target_store
+        self.__sibling_indices = dict()
+        self.__lock = threading.Lock()
+
+    def reset(self):
+        """Drops the sibling indices, they are rebuilt from the stores on the next use.
+        Has to be called whenever a store is (re)created."""
+        with self.__lock:
+            self.__sibling_indices = dict()
+
+    def __sibling_index(self, is_source: bool) -> SiblingIndex:
+        sibling_index = self.__sibling_indices.get(is_source)
+        if sibling_index is None:
+            with self.__lock:
+                sibling_index = self.__sibling_indices.get(is_source)
+                if sibling_index is None:
+                    sibling_index = SiblingIndex(self.source_store if is_source else self.target_store)
+                    self.__sibling_indices[is_source] = sibling_index
+        return sibling_index
 
     def neighbouring_sibling_context(self, is_source: bool, element: Element, pre: int, post: int) -> (str, str):
         """Provides the content of siblings of the given element.
@@ -18,20 +67,9 @@ class ContextProvider:
         if pre == 0 and post == 0:
             return "", ""
 
-        store = self.source_store if is_source else self.target_store
-
-        siblings = [x.element for x in store.get_by_parent_id(element.parent.identifier)]
-        # Simple natural sort, might break for edge cases
-        siblings = sorted(siblings, key=lambda x: [int(y) if y.isdigit() else y.lower() for y in re.split("(\\d+)", x.identifier)])
-        index = [index for index, value in enumerate(siblings) if value.identifier == element.identifier][0]
-
-        pre_start = max(index-pre, 0)
-        pre_context = siblings[pre_start:index]
-        post_end = min(index+post, len(siblings)-1)
-        post_context = siblings[index+1:post_end+1]
+        pre_context, post_context = self.__sibling_index(is_source).neighbours(element, pre, post)
 
         pre_text = "\n".join(element.content for element in pre_context)
         post_text = "\n".join(element.content for element in post_context)
 
         return pre_text, post_text
-
@@ -1,4 +1,5 @@
 from .classifier import Classifier, Element, ClassificationResult
+from .classification_scheduler import ClassificationScheduler
 from .context_provider import ContextProvider
 
 from ..module import ModuleConfiguration
@@ -10,4 +11,7 @@ class MockClassifier(Classifier):
 
     def classify(self, source: Element, targets: list[Element]) -> ClassificationResult:
         return ClassificationResult(source=source, targets=targets)
-    
\ No newline at end of file
+
+    def classify_all(self, queries: list[tuple[Element, list[Element]]],
+                     scheduler: ClassificationScheduler) -> list[ClassificationResult]:
+        return [self.classify(source, targets) for source, targets in queries]
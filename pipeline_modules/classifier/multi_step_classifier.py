@@ -11,6 +11,8 @@ from langchain_core.runnables import Runnable
 
 from cache.cache_manager import CacheManager
 from .classifier import Classifier, ClassificationResult, Element
+from .classification_planner import ClassificationPlanner
+from .classification_scheduler import ClassificationScheduler
 from .context_provider import ContextProvider
 from ..module import ModuleConfiguration
 
@@ -104,6 +106,8 @@ class MultiStepClassifier(Classifier):
     __chains: list[Runnable]
 
     __use_original_artifacts: bool
+    # Used by classify, classify_all gets the scheduler of the controller
+    __scheduler: ClassificationScheduler
 
     __context_provider: ContextProvider
 
@@ -126,6 +130,7 @@ class MultiStepClassifier(Classifier):
         self.__chains = list()
         for prompt in self.__langchain_prompts:
             self.__chains.append(prompt | self.__llm | self.__parser)
+        self.__scheduler = ClassificationScheduler()
         self.__configuration = configuration
 
     def __setup_prompts(self):
@@ -153,23 +158,21 @@ class MultiStepClassifier(Classifier):
         config.args["model"] = self.__configuration.args["model"]
         return config
 
-    def __get_cached(self, prompt_template: str, input: dict[str, str]) -> dict | None:
-        input_key = self.__get_input_key(prompt_template, input)
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=input_key)
-        if data:
-            return data[0]
-        return None
-
-    def __cache_target(self, prompt_template: str, input: dict[str, str], source: Element, target: Element,
-                       output: str):
-        data = {
-            "source": source.identifier,
-            "target": target.identifier,
-            "output": output,
-        }
-        CacheManager.get_cache().put(configuration=self.__configuration,
-                                     input=self.__get_input_key(prompt_template, input),
-                                     data=data)
+    def __get_cached(self, input_keys: list[str]) -> list[dict | None]:
+        data = CacheManager.get_cache().get_many(configuration=self.__configuration, input_keys=input_keys)
+        return [rows[0] if rows else None for rows in data]
+
+    def __cache_targets(self, prompt_template: str,
+                        results: list[tuple[dict[str, str], Element, Element, str]]):
+        entries = list()
+        for input, source, target, output in results:
+            data = {
+                "source": source.identifier,
+                "target": target.identifier,
+                "output": output,
+            }
+            entries.append((self.__get_input_key(prompt_template, input), data))
+        CacheManager.get_cache().put_many(configuration=self.__configuration, entries=entries)
 
     def original_artifact(self, element: Element) -> Element:
         while element.granularity > 0:
@@ -193,22 +196,24 @@ class MultiStepClassifier(Classifier):
         relevant_post = post if post_used else 0
         return self.__context_provider.neighbouring_sibling_context(is_source, element, relevant_pre, relevant_post)
 
-    def __step(self, index: int, source: Element, targets: list[Element]) -> (list[Element], list[Element]):
-        related_targets = list()
-        continue_targets = list()
-
-        source_pre, source_post = self.__get_relevant_neighbouring_sibling_context(element=source,
-                                                                                   pre=self.__source_pre_context,
-                                                                                   post=self.__source_post_context,
-                                                                                   is_source=True,
-                                                                                   prompt=self.__prompts[index])
-        for target in targets:
-            target_pre, target_post = self.__get_relevant_neighbouring_sibling_context(element=target,
-                                                                                       pre=self.__target_pre_context,
-                                                                                       post=self.__target_post_context,
-                                                                                       is_source=False,
-                                                                                       prompt=self.__prompts[index])
-            input = {
+    def __step(self, index: int, queries: list[tuple[Element, list[Element]]],
+               scheduler: ClassificationScheduler) -> list[tuple[list[Element], list[Element]]]:
+        """Runs prompt step index for all (source, targets) queries.
+        Returns the related targets and the targets to continue with of every query."""
+        prompt = self.__prompts[index]
+        prompt_template = prompt.template_json()
+        source_contexts = dict()
+
+        def input_for(source: Element, target: Element) -> dict[str, str]:
+            if source.identifier not in source_contexts:
+                source_contexts[source.identifier] = self.__get_relevant_neighbouring_sibling_context(
+                    element=source, pre=self.__source_pre_context, post=self.__source_post_context, is_source=True,
+                    prompt=prompt)
+            source_pre, source_post = source_contexts[source.identifier]
+            target_pre, target_post = self.__get_relevant_neighbouring_sibling_context(
+                element=target, pre=self.__target_pre_context, post=self.__target_post_context, is_source=False,
+                prompt=prompt)
+            return {
                 "source_type": source.type,
                 "target_type": target.type,
                 "source_content": source.content,
@@ -218,45 +223,62 @@ class MultiStepClassifier(Classifier):
                 "target_context_pre": target_pre,
                 "target_context_post": target_post
             }
-            data = self.__get_cached(self.__prompts[index].template_json(), input)
-            if data is not None:
-                status = self.__prompts[index].status(data['output'])
-                if status == StepResult.RELATED:
-                    related_targets.append(target)
-                elif status == StepResult.CONTINUE:
-                    continue_targets.append(target)
-            else:
-                print("Invoking the LLM for " + source.identifier + " : " + target.identifier)
-                output = self.__chains[index].invoke(input)
-                self.__cache_target(prompt_template=self.__prompts[index].template_json(),
-                                    input=input,
-                                    source=source,
-                                    target=target,
-                                    output=output)
-                status = self.__prompts[index].status(output)
+
+        # Equal prompts of different queries are looked up and sent once
+        planner = ClassificationPlanner(queries, lambda source, target: self.__get_input_key(
+            prompt_template, input_for(source, target)))
+        outputs = [data['output'] if data is not None else None for data in self.__get_cached(planner.keys)]
+        uncached = planner.misses(outputs)
+        inputs = [input_for(*planner.pairs[position]) for position in uncached]
+        for position in uncached:
+            print("Invoking the LLM for " + planner.pairs[position][0].identifier + " : "
+                  + planner.pairs[position][1].identifier)
+        for start, chunk in scheduler.run(self.__chains[index], inputs, "openai"):
+            results = list()
+            for position, input, output in zip(uncached[start:start + len(chunk)], inputs[start:start + len(chunk)],
+                                               chunk):
+                outputs[position] = output
+                results.append((input, *planner.pairs[position], output))
+            self.__cache_targets(prompt_template=prompt_template, results=results)
+
+        steps = list()
+        for (source, targets), query_outputs in zip(queries, planner.fan_out(outputs)):
+            related_targets = list()
+            continue_targets = list()
+            for target, output in zip(targets, query_outputs):
+                status = prompt.status(output)
                 if status == StepResult.RELATED:
                     related_targets.append(target)
                 elif status == StepResult.CONTINUE:
                     continue_targets.append(target)
+            steps.append((related_targets, continue_targets))
+        return steps
 
-        return related_targets, continue_targets
+    def __invoke_elements(self, source: Element, targets: list[Element]) -> (Element, list[Element]):
+        if not self.__use_original_artifacts:
+            return source, targets
+        invoke_targets = list()
+        for target in targets:
+            original = self.original_artifact(target)
+            if original.identifier not in [element.identifier for element in invoke_targets]:
+                invoke_targets.append(original)
+        return self.original_artifact(source), invoke_targets
 
     def classify(self, source: Element, targets: list[Element]) -> ClassificationResult:
-        invoke_source = source
-        invoke_targets = list()
-        if self.__use_original_artifacts:
-            invoke_source = self.original_artifact(source)
-            for target in targets:
-                original = self.original_artifact(target)
-                if original.identifier not in [element.identifier for element in invoke_targets]:
-                    invoke_targets.append(original)
-        else:
-            invoke_targets = targets
-
-        related = list()
+        return self.classify_all([(source, targets)], self.__scheduler)[0]
+
+    def classify_all(self, queries: list[tuple[Element, list[Element]]],
+                     scheduler: ClassificationScheduler) -> list[ClassificationResult]:
+        invoke_queries = [self.__invoke_elements(source, targets) for source, targets in queries]
+        related = [list() for _ in invoke_queries]
+        # Every step only gets the targets the previous step continued with
+        step_queries = invoke_queries
         for i in range(len(self.__prompts)):
-            related_targets, continue_targets = self.__step(index=i, source=invoke_source, targets=invoke_targets)
-            related += related_targets
-            invoke_targets = continue_targets
-
-        return ClassificationResult(invoke_source, related)
+            steps = self.__step(index=i, queries=step_queries, scheduler=scheduler)
+            for query_related, (related_targets, _) in zip(related, steps):
+                query_related += related_targets
+            step_queries = [(source, continue_targets)
+                            for (source, _), (_, continue_targets) in zip(step_queries, steps)]
+
+        return [ClassificationResult(source, query_related)
+                for (source, _), query_related in zip(invoke_queries, related)]
@@ -8,6 +8,7 @@ from langchain_core.runnables import Runnable
 
 from cache.cache_manager import CacheManager
 from .classifier import Classifier, ClassificationResult, Element
+from .classification_scheduler import ClassificationScheduler
 from .context_provider import ContextProvider
 from ..module import ModuleConfiguration
 
@@ -42,24 +43,22 @@ class SelectionClassifier(Classifier):
         input_key = json.dumps(inputs, sort_keys=True)
         return input_key
 
-    def __get_cached_related(self, source: Element, target: Element) -> bool | None:
-        input_key = self.__get_input_key(source, target)
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=input_key)
-        if data:
-            related = data[0]["related"]
-            return related
-
-        return None
-
-    def __cache_target(self, source: Element, target: Element, output: str, related: bool):
-        data = {
-            "source": source.identifier,
-            "target": target.identifier,
-            "output": output,
-            "related": related
-        }
-        CacheManager.get_cache().put(configuration=self.__configuration, input=self.__get_input_key(source, target),
-                                     data=data)
+    def __get_cached_related(self, source: Element, targets: list[Element]) -> list[bool | None]:
+        input_keys = [self.__get_input_key(source, target) for target in targets]
+        data = CacheManager.get_cache().get_many(configuration=self.__configuration, input_keys=input_keys)
+        return [rows[0]["related"] if rows else None for rows in data]
+
+    def __cache_targets(self, source: Element, results: list[tuple[Element, str, bool]]):
+        entries = list()
+        for target, output, related in results:
+            data = {
+                "source": source.identifier,
+                "target": target.identifier,
+                "output": output,
+                "related": related
+            }
+            entries.append((self.__get_input_key(source, target), data))
+        CacheManager.get_cache().put_many(configuration=self.__configuration, entries=entries)
 
     def is_related(self, output: str) -> bool:
         match = re.search("<trace>(.*?)</trace>", output.lower())
@@ -88,8 +87,7 @@ class SelectionClassifier(Classifier):
         else:
             invoke_targets = targets
 
-        for target in invoke_targets:
-            related = self.__get_cached_related(invoke_source, target)
+        for target, related in zip(invoke_targets, self.__get_cached_related(invoke_source, invoke_targets)):
             if related is not None:
                 if related:
                     related_targets.append(target)
@@ -102,11 +100,16 @@ class SelectionClassifier(Classifier):
                                 "target_content": target.content}))
 
         outputs = self.chain.batch(inputs=[x[1] for x in inputs])
-        results = zip([x[0] for x in inputs], outputs)
-        for result in results:
-            related = self.is_related(result[1])
+        results = list()
+        for target, output in zip([x[0] for x in inputs], outputs):
+            related = self.is_related(output)
             if related:
-                related_targets.append(result[0])
-            self.__cache_target(source=invoke_source, target=result[0], output=result[1], related=related)
+                related_targets.append(target)
+            results.append((target, output, related))
+        self.__cache_targets(source=invoke_source, results=results)
 
         return ClassificationResult(invoke_source, related_targets)
+
+    def classify_all(self, queries: list[tuple[Element, list[Element]]],
+                     scheduler: ClassificationScheduler) -> list[ClassificationResult]:
+        return [self.classify(source, targets) for source, targets in queries]
@@ -9,6 +9,8 @@ from langchain_core.runnables import Runnable
 
 from cache.cache_manager import CacheManager
 from .classifier import Classifier, ClassificationResult, Element
+from .classification_planner import ClassificationPlanner
+from .classification_scheduler import ClassificationScheduler
 from .context_provider import ContextProvider
 from ..module import ModuleConfiguration
 
@@ -20,6 +22,8 @@ class SimpleOllamaClassifier(Classifier):
     __llm: ChatOllama
     __parser: StrOutputParser
     __chain: Runnable
+    # Used by classify, classify_all gets the scheduler of the controller
+    __scheduler: ClassificationScheduler
 
     __context_provider: ContextProvider
 
@@ -41,6 +45,7 @@ class SimpleOllamaClassifier(Classifier):
                                 headers=headers)
         self.__parser = StrOutputParser()
         self.__chain = self.__prompt | self.__llm | self.__parser
+        self.__scheduler = ClassificationScheduler()
 
     def __setup_prompt(self):
         template = """Question: Here are two parts of software development artifacts. \n
@@ -60,52 +65,52 @@ class SimpleOllamaClassifier(Classifier):
         input_key = json.dumps(inputs, sort_keys=True)
         return input_key
 
-    def __get_cached_related(self, source: Element, target: Element) -> bool | None:
-        input_key = self.__get_input_key(source, target)
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=input_key)
-        if data:
-            related = data[0]["related"]
-            return related
-
-        return None
-
-    def __cache_target(self, source: Element, target: Element, output: str, related: bool):
-        data = {
-            "source": source.identifier,
-            "target": target.identifier,
-            "output": output,
-            "related": related
-        }
-        CacheManager.get_cache().put(configuration=self.__configuration, input=self.__get_input_key(source, target),
-                                     data=data)
+    def __get_cached_related(self, input_keys: list[str]) -> list[bool | None]:
+        data = CacheManager.get_cache().get_many(configuration=self.__configuration, input_keys=input_keys)
+        return [rows[0]["related"] if rows else None for rows in data]
+
+    def __cache_targets(self, results: list[tuple[Element, Element, str, bool]]):
+        entries = list()
+        for source, target, output, related in results:
+            data = {
+                "source": source.identifier,
+                "target": target.identifier,
+                "output": output,
+                "related": related
+            }
+            entries.append((self.__get_input_key(source, target), data))
+        CacheManager.get_cache().put_many(configuration=self.__configuration, entries=entries)
 
     def __is_related(self, output: str) -> bool:
         related = "yes" in output.lower()
         return related
 
     def classify(self, source: Element, targets: list[Element]) -> ClassificationResult:
-        related_targets = list()
+        return self.classify_all([(source, targets)], self.__scheduler)[0]
+
+    def classify_all(self, queries: list[tuple[Element, list[Element]]],
+                     scheduler: ClassificationScheduler) -> list[ClassificationResult]:
+        # Equal pairs of different queries are looked up and classified once
+        planner = ClassificationPlanner(queries, self.__get_input_key)
+        related = self.__get_cached_related(planner.keys)
 
+        uncached = planner.misses(related)
         inputs = list()
-        for target in targets:
-            related = self.__get_cached_related(source, target)
-            if related is not None:
-                if related:
-                    related_targets.append(target)
-            else:
-                print("Invoking the LLM for " + source.identifier + " : " + target.identifier)
-                inputs.append((target,
-                               {"source_type": source.type,
-                                "target_type": target.type,
-                                "source_content": source.content,
-                                "target_content": target.content}))
-
-        outputs = self.__chain.batch(inputs=[x[1] for x in inputs])
-        results = zip([x[0] for x in inputs], outputs)
-        for result in results:
-            related = self.__is_related(result[1])
-            if related:
-                related_targets.append(result[0])
-            self.__cache_target(source=source, target=result[0], output=result[1], related=related)
-
-        return ClassificationResult(source, related_targets)
+        for index in uncached:
+            source, target = planner.pairs[index]
+            print("Invoking the LLM for " + source.identifier + " : " + target.identifier)
+            inputs.append({"source_type": source.type,
+                           "target_type": target.type,
+                           "source_content": source.content,
+                           "target_content": target.content})
+
+        for start, outputs in scheduler.run(self.__chain, inputs, "ollama"):
+            results = list()
+            for index, output in zip(uncached[start:start + len(outputs)], outputs):
+                related[index] = self.__is_related(output)
+                results.append((*planner.pairs[index], output, related[index]))
+            self.__cache_targets(results=results)
+
+        return [ClassificationResult(source, [target for target, is_related in zip(targets, query_related)
+                                              if is_related])
+                for (source, targets), query_related in zip(queries, planner.fan_out(related))]
@@ -1,8 +1,16 @@
+import gc
+import json
+import os
 from hashlib import sha256
 from hashlib import shake_128
+from typing import Iterable
 
 import chromadb
+import numpy as np
 
+from cache.lru_cache import LRUCache
+
+from .dynamic_cutoff import dynamic_n
 from .element_store import ElementStore, EmbeddedElement
 from ..embedding_creator.embedding_creator import Embedding
 from ..knowledge import Element
@@ -12,16 +20,22 @@ from ..module import ModuleConfiguration
 class ChromaElementStore(ElementStore):
     __N_ALL = "all"
     __N_DYNAMIC = "dynamic"
+    # Upper bound of the results returned by one query call with several query embeddings
+    __MAX_QUERY_RESULTS = 100000
 
     __configuration: ModuleConfiguration
     __direction: str
     __n_results: int | str
     __threshold: float
     __use_dynamic_n: bool
+    __dynamic_min_n: int
+    __dynamic_max_n: int
+    __dynamic_margin: float
     __similarity_function: str
     __compare_length: int = 0
-    __db: chromadb.ClientAPI
+    __db: chromadb.ClientAPI | None
     __collection: chromadb.Collection | None
+    __elements: LRUCache
 
     def __init__(self, configuration: ModuleConfiguration):
         self.__configuration = configuration
@@ -30,8 +44,19 @@ class ChromaElementStore(ElementStore):
         self.__similarity_function = self.__configuration.args.setdefault("similarity_function", "cosine")
         self.__threshold = self.__configuration.args.setdefault("threshold", 1.0)
         self.__use_dynamic_n = self.__configuration.args.get("dynamic_n", False)
+        if self.__n_results == self.__N_DYNAMIC:
+            self.__use_dynamic_n = True
+        # With dynamic_n, a numeric n_results is the maximum number of results
+        self.__dynamic_min_n = self.__configuration.args.get("dynamic_min_n", 1)
+        self.__dynamic_max_n = self.__configuration.args.get(
+            "dynamic_max_n", 40 if self.__n_results in (self.__N_DYNAMIC, self.__N_ALL) else self.__n_results)
+        self.__dynamic_margin = self.__configuration.args.get("dynamic_margin", 0.05)
+        # Hydrated elements of this store, bounded by their number
+        self.__elements = LRUCache(max_entries=self.__configuration.args.get("element_cache_size", 100000))
 
-        self.__db = chromadb.PersistentClient(path=self.__configuration.args["path"])
+        # chromadb shares one system between the clients of a path, the resolved path makes paths written differently
+        # (e.g. with a trailing slash) share it as well
+        self.__db = chromadb.PersistentClient(path=os.path.realpath(self.__configuration.args["path"]))
 
     def __parse_n(self, n: int | str) -> int | str:
         # TODO: is there a nicer way?
@@ -61,88 +86,127 @@ class ChromaElementStore(ElementStore):
     def create_vector_store(self,
                             previous_modules_key: str,
                             entries: list[EmbeddedElement]):
+        self.create_vector_store_from_batches(previous_modules_key, [entries])
+
+    def create_vector_store_from_batches(self,
+                                         previous_modules_key: str,
+                                         batches: Iterable[list[EmbeddedElement]]):
         collection_name = self.__collection_name(previous_modules_key)
+        self.__elements.clear()
         self.__collection = self.__db.get_or_create_collection(name=collection_name,
                                                                metadata={"hnsw:space": self.__similarity_function,
                                                                      "hnsw:M": 32,
                                                                      }
                                                                )
 
-        embeddings = list()
-        ids = list()
-        documents = list()
-        metadatas = list()
-
-        # TODO: Check if elements/embeddings are the same. Raise error if not
-        if self.__collection.count() == 0:
-            for emb_element in entries:
-                embeddings.append(emb_element.embedding.embedding)
-
-                element = emb_element.element
-                ids.append(element.identifier)
-                documents.append(element.content)
-                metadata = {"type": element.type,
-                            "granularity": element.granularity,
-                            "parent": element.parent.identifier if element.granularity != 0 else "",
-                            "compare": element.compare}
-                metadatas.append(metadata)
+        # Only new and changed elements are written, elements that are no longer part of the entries are deleted
+        stored = self.__collection.get(include=["metadatas"])
+        stored_hashes = {identifier: metadata.get("content_hash")
+                         for identifier, metadata in zip(stored["ids"], stored["metadatas"])}
+        del stored
+        seen = set()
+        changed_count = 0
+        for entries in batches:
+            ids, embeddings, documents, metadatas = self.__columns(entries)
+            seen.update(ids)
+            changed = [index for index, identifier in enumerate(ids)
+                       if stored_hashes.get(identifier) != metadatas[index]["content_hash"]]
+            changed_count += len(changed)
 
             # Split due to maximum batch size of 5461
-            start_index = 0
-            end_index = min(1000, len(ids))
-            while start_index < len(ids):
-                self.__collection.add(ids=ids[start_index:end_index],
-                                      embeddings=embeddings[start_index:end_index],
-                                      documents=documents[start_index:end_index],
-                                      metadatas=metadatas[start_index:end_index])
-                start_index = end_index
-                end_index = min(start_index + 1000, len(ids))
+            for start_index in range(0, len(changed), 1000):
+                batch = changed[start_index:start_index + 1000]
+                self.__collection.upsert(ids=[ids[index] for index in batch],
+                                         embeddings=[embeddings[index] for index in batch],
+                                         documents=[documents[index] for index in batch],
+                                         metadatas=[metadatas[index] for index in batch])
+        removed = list(stored_hashes.keys() - seen)
+        for start_index in range(0, len(removed), 1000):
+            self.__collection.delete(ids=removed[start_index:start_index + 1000])
+        if changed_count or removed:
+            print(f"Updated vector store {collection_name}: {changed_count} added or changed, {len(removed)} removed, "
+                  f"{len(seen) - changed_count} unchanged")
 
         self.__compare_length = len(self.__collection.get(where={"compare": True})['ids'])
 
+    def __columns(self, entries: list[EmbeddedElement]) -> tuple[list[str], list[list[float]], list[str], list[dict]]:
+        ids = list()
+        embeddings = list()
+        documents = list()
+        metadatas = list()
+        for emb_element in entries:
+            element = emb_element.element
+            metadata = {"type": element.type,
+                        "granularity": element.granularity,
+                        "parent": element.parent.identifier if element.granularity != 0 else "",
+                        "compare": element.compare}
+            metadata["content_hash"] = self.__content_hash(element.content, metadata, emb_element.embedding)
+            ids.append(element.identifier)
+            embeddings.append(emb_element.embedding.embedding)
+            documents.append(element.content)
+            metadatas.append(metadata)
+        return ids, embeddings, documents, metadatas
+
+    def __content_hash(self, content: str, metadata: dict, embedding: Embedding) -> str:
+        """Hash of everything stored for an element, used to detect changed elements."""
+        hash = sha256()
+        hash.update(json.dumps([content, metadata], sort_keys=True).encode())
+        hash.update(np.asarray(embedding.embedding, dtype=np.float32).tobytes())
+        return hash.hexdigest()
+
     def find_similar(self, query: Embedding) -> list[Element]:
         elements, distances = self.find_similar_with_distances(query)
         return elements
 
-    def __calculate_dynamic_n(self, distances: list[float]) -> int:
-        # TODO: implement or delete
-        pass
-
     def find_similar_with_distances(self, query: Embedding) -> (list[Element], list[float]):
+        return self.__find_similar_many_with_distances([query])[0]
+
+    def find_similar_many(self, queries: list[Embedding]) -> list[list[Element]]:
+        return [elements for elements, distances in self.__find_similar_many_with_distances(queries)]
+
+    def __find_similar_many_with_distances(self,
+                                           queries: list[Embedding]) -> list[tuple[list[Element], list[float]]]:
         metadata_filter = {
             "compare": True
         }
-        # To ensure determinism: get all elements and cut off later
-        results = self.__collection.query(query.embedding, n_results=self.__compare_length, where=metadata_filter,
-                                          include=["distances"])
-        sorted_results = sorted(zip(results["distances"][0], results["ids"][0]))
+        selected = list()
+        # Every query returns all compared elements, so the batches are limited by the number of returned results
+        batch_size = max(1, self.__MAX_QUERY_RESULTS // max(1, self.__compare_length))
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            # To ensure determinism: get all elements and cut off later
+            batch_results = self.__collection.query(query_embeddings=[query.embedding for query in batch],
+                                                    n_results=self.__compare_length, where=metadata_filter,
+                                                    include=["distances"])
+            for distances, ids in zip(batch_results["distances"], batch_results["ids"]):
+                selected.append(self.__select(distances, ids))
+        if self.__use_dynamic_n:
+            counts = dynamic_n([[distance for distance, _ in results] for results in selected],
+                               self.__dynamic_min_n, self.__dynamic_max_n, self.__dynamic_margin)
+            selected = [results[:count] for results, count in zip(selected, counts)]
+
+        # The results of all queries are hydrated together
+        elements = self.__get_many([identifier for results in selected for _, identifier in results])
+        return [([elements[identifier] for _, identifier in results], [distance for distance, _ in results])
+                for results in selected]
+
+    def __select(self, distances: list[float], ids: list[str]) -> list[tuple[float, str]]:
+        sorted_results = sorted(zip(distances, ids))
         sorted_results = [x for x in sorted_results if x[0] <= self.__threshold]
 
-        if self.__n_results == self.__N_ALL:
+        if self.__use_dynamic_n:
+            # Cut off for all queries at once in __find_similar_many_with_distances
+            sorted_results = sorted_results[:self.__dynamic_max_n]
+        elif self.__n_results == self.__N_ALL:
             sorted_results = sorted_results
-        elif self.__n_results == self.__N_DYNAMIC:
-            sorted_results = sorted_results[:self.__calculate_dynamic_n(results["distances"][0])] # TODO: see __calculate_dynamic_n()
         else:
             sorted_results = sorted_results[:self.__n_results]
-
-        elements = list()
-        distances = [x[0] for x in sorted_results]
-        for result in sorted_results:
-            elements.append(self.get_by_id(identifier=result[1]))
-        return elements, distances
-
-    requested_elements: dict[str, Element] = {}
+        return sorted_results
 
     def get_by_id(self, identifier: str) -> Element:
-        element = self.requested_elements.get(identifier)
-        if element:
-            return element
+        return self.__get_many([identifier])[identifier]
 
-        result = self.__collection.get(ids=identifier)
-
-        identifier = result["ids"][0]
-        document = result["documents"][0]
-        metadata = result["metadatas"][0]
+    def __element_from_result(self, identifier: str, document: str, metadata: dict) -> Element:
         element_dict = {
             "identifier": identifier,
             "type": metadata["type"],
@@ -150,21 +214,55 @@ class ChromaElementStore(ElementStore):
             "granularity": metadata["granularity"],
             "compare": metadata["compare"]
             }
-        element = Element.element_from_dict(element=element_dict)
-        if element.granularity != 0:
-            element.parent = self.get_by_id(metadata["parent"])
-        self.requested_elements[identifier] = element
-        return element
+        return Element.element_from_dict(element=element_dict)
+
+    def __get_many(self, identifiers: list[str],
+                   results: tuple[list[str], list[str], list[dict]] | None = None) -> dict[str, Element]:
+        """Returns the elements of the identifiers with their parents linked.
+        Elements that are not in memory are fetched level by level, with one get call per level of ancestors.
+        Already fetched (ids, documents, metadatas) can be passed as results to skip fetching them again."""
+        elements = dict()
+        parents = dict()
+        missing = list()
+        for identifier in identifiers:
+            element = self.__elements.get(identifier)
+            if element is not None:
+                elements[identifier] = element
+            elif identifier not in elements:
+                missing.append(identifier)
+
+        while missing or results is not None:
+            if results is None:
+                missing = list(dict.fromkeys(missing))
+                fetched = self.__collection.get(ids=missing, include=["documents", "metadatas"])
+                results = (fetched["ids"], fetched["documents"], fetched["metadatas"])
+            missing = list()
+            for identifier, document, metadata in zip(*results):
+                if identifier in elements:
+                    continue
+                element = self.__element_from_result(identifier, document, metadata)
+                elements[identifier] = element
+                if element.granularity != 0:
+                    parents[identifier] = metadata["parent"]
+                    parent = self.__elements.get(metadata["parent"])
+                    if parent is not None:
+                        elements.setdefault(metadata["parent"], parent)
+                    elif metadata["parent"] not in elements:
+                        missing.append(metadata["parent"])
+            results = None
+
+        for identifier, parent in parents.items():
+            elements[identifier].parent = elements[parent]
+        for identifier, element in elements.items():
+            self.__elements.put(identifier, element)
+        return elements
 
     def __get_by_metadata_filter(self, metadata_filter: dict[str, str | bool]) -> list[EmbeddedElement]:
-        results = self.__collection.get(where=metadata_filter, include=["embeddings"])
+        results = self.__collection.get(where=metadata_filter, include=["embeddings", "documents", "metadatas"])
         ids = results["ids"]
         embeddings = results["embeddings"]
-        elements = list()
-        for i in range(len(ids)):
-            element = self.get_by_id(ids[i])
-            elements.append(EmbeddedElement(element, Embedding(embeddings[i])))
-        return elements
+        elements = self.__get_many(ids, (ids, results["documents"], results["metadatas"]))
+        return [EmbeddedElement(elements[ids[i]], Embedding(embeddings[i])) for i in range(len(ids))]
 
     def get_by_parent_id(self, identifier: str) -> list[EmbeddedElement]:
         metadata_filter = {
@@ -177,3 +275,13 @@ class ChromaElementStore(ElementStore):
         if compare:
             metadata_filter["compare"] = True
         return self.__get_by_metadata_filter(metadata_filter)
+
+    def close(self):
+        # chromadb has no public way to close a client. Its system, which holds the database connections and
+        # segments of the path, is released once neither chromadb's registry nor a client references it.
+        self.__elements.clear()
+        self.__collection = None
+        self.__db.clear_system_cache()
+        self.__db = None
+        # The components of a system reference each other, their connections are closed by the cycle collector
+        gc.collect()
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def dynamic_n(distances: list[list[float]], min_n: int, max_n: int, margin: float) -> list[int]:
+    """Chooses the number of candidates to keep for every query from its ascending distances.
+
+    The candidates are cut at the largest gap between consecutive distances among the first max_n candidates,
+    keeping at least min_n. Candidates behind the cut whose distance exceeds the last kept distance by at most
+    margin times the distance span of the first max_n candidates are kept as well, so near ties are not separated.
+    All queries are processed together."""
+    if not distances:
+        return []
+    width = max(1, min(max_n, max(len(query_distances) for query_distances in distances)))
+    window = np.full((len(distances), width), np.inf)
+    for row, query_distances in enumerate(distances):
+        window[row, :min(width, len(query_distances))] = query_distances[:width]
+    counts = np.isfinite(window).sum(axis=1)
+
+    # Missing candidates are set to 0 for the arithmetic and excluded by counts
+    finite = np.where(np.isfinite(window), window, 0)
+
+    # gaps[:, j] is the gap behind candidate j, cutting there keeps j + 1 candidates
+    gaps = np.diff(finite, axis=1)
+    kept = np.arange(1, width)
+    allowed = (kept >= min_n) & (kept[None, :] < counts[:, None])
+    gaps = np.where(allowed, gaps, -np.inf)
+    n = np.where(allowed.any(axis=1), gaps.argmax(axis=1) + 1, np.minimum(counts, max(min_n, 0)))
+
+    rows = np.arange(len(distances))
+    span = finite[rows, np.maximum(counts - 1, 0)] - finite[:, 0]
+    limit = finite[rows, np.maximum(n - 1, 0)] + margin * span
+    n = np.maximum(n, (window <= limit[:, None]).sum(axis=1))
+    return np.minimum(n, counts).tolist()
@@ -1,3 +1,4 @@
+from typing import Iterable
 from typing import NamedTuple
 from typing import Protocol
 
@@ -18,12 +19,23 @@ class ElementStore(Protocol):
                             entries: list[EmbeddedElement]):
         ...
 
+    def create_vector_store_from_batches(self,
+                                         previous_modules_key: str,
+                                         batches: Iterable[list[EmbeddedElement]]):
+        """Same as create_vector_store with the entries of all batches.
+        Stores that do not keep their entries in memory write every batch before the next one is requested."""
+        ...
+
     def find_similar(self, query: Embedding) -> list[Element]:
         ...
 
     def find_similar_with_distances(self, query: Embedding) -> (list[Element], list[float]):
         ...
 
+    def find_similar_many(self, queries: list[Embedding]) -> list[list[Element]]:
+        """Returns the result of find_similar for every query. Stores answer all queries in as few calls as possible."""
+        ...
+
     def get_by_id(self, identifier: str) -> Element:
         ...
 
@@ -33,14 +45,25 @@ class ElementStore(Protocol):
     def get_all_elements(self, compare: bool = False) -> list[EmbeddedElement]:
         ...
 
+    def close(self):
+        """Releases the files and connections of the store, which cannot be queried afterwards.
+        Stores holding everything in memory have nothing to release."""
+        ...
+
 
 class ElementStoreBuilder:
     from .mock_element_store import MockElementStore
     from .chroma_element_store import ChromaElementStore
+    from .quantized_element_store import QuantizedElementStore
+    from .numpy_element_store import NumpyElementStore
+    from .ivf_element_store import IVFElementStore
 
     STORES = {
         'mock': MockElementStore,
-        'chroma': ChromaElementStore
+        'chroma': ChromaElementStore,
+        'quantized': QuantizedElementStore,
+        'numpy': NumpyElementStore,
+        'ivf': IVFElementStore
     }
 
     def build_element_store(self, configuration: ModuleConfiguration) -> ElementStore:
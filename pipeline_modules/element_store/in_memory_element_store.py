@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+import numpy as np
+
+from .dynamic_cutoff import dynamic_n
+from .element_store import ElementStore, EmbeddedElement
+from ..embedding_creator.embedding_creator import Embedding
+from ..knowledge import Element
+from ..module import ModuleConfiguration
+
+
+class InMemoryElementStore(ElementStore, ABC):
+    """Base class of element stores holding their elements in memory and searching their embeddings with NumPy.
+    Results follow the chroma store: only elements with compare set are searched, distances above threshold
+    are dropped and the n_results nearest are returned, sorted by distance and identifier.
+    With n_results "dynamic" or dynamic_n, the number of results is chosen per query by dynamic_cutoff.dynamic_n.
+
+    Subclasses index the embeddings in _index and return the distances of candidate rows in _search."""
+    N_ALL = "all"
+    N_DYNAMIC = "dynamic"
+
+    configuration: ModuleConfiguration
+    n_results: int | str
+    threshold: float
+    similarity_function: str
+    use_dynamic_n: bool
+    dynamic_min_n: int
+    dynamic_max_n: int
+    dynamic_margin: float
+
+    __elements: list[Element]
+    __indices: dict[str, int]
+    __children: dict[str, list[int]]
+    compare_indices: np.ndarray
+
+    def __init__(self, configuration: ModuleConfiguration):
+        self.configuration = configuration
+        n_results = self.configuration.args.get("n_results", 10)
+        self.n_results = n_results if n_results in (self.N_ALL, self.N_DYNAMIC) else int(n_results)
+        self.similarity_function = self.configuration.args.setdefault("similarity_function", "cosine")
+        self.threshold = self.configuration.args.setdefault("threshold", 1.0)
+        self.use_dynamic_n = self.n_results == self.N_DYNAMIC or self.configuration.args.get("dynamic_n", False)
+        self.dynamic_min_n = self.configuration.args.get("dynamic_min_n", 1)
+        self.dynamic_max_n = self.configuration.args.get(
+            "dynamic_max_n", 40 if self.n_results in (self.N_DYNAMIC, self.N_ALL) else self.n_results)
+        self.dynamic_margin = self.configuration.args.get("dynamic_margin", 0.05)
+        self.__elements = list()
+        self.__indices = dict()
+        self.__children = dict()
+        self.compare_indices = np.zeros(0, dtype=np.int64)
+
+    def create_vector_store(self, previous_modules_key: str, entries: list[EmbeddedElement]):
+        self.__elements = [entry.element for entry in entries]
+        self.__indices = {element.identifier: index for index, element in enumerate(self.__elements)}
+        self.__children = dict()
+        for index, element in enumerate(self.__elements):
+            if element.parent is not None:
+                self.__children.setdefault(element.parent.identifier, []).append(index)
+        self.compare_indices = np.array([index for index, element in enumerate(self.__elements) if element.compare],
+                                        dtype=np.int64)
+        if not entries:
+            # Nothing to index, searches return no results
+            return
+        matrix = np.asarray([entry.embedding.embedding for entry in entries], dtype=np.float32)
+        self._index(previous_modules_key, entries, matrix.reshape(len(entries), -1))
+
+    def create_vector_store_from_batches(self, previous_modules_key: str, batches: Iterable[list[EmbeddedElement]]):
+        self.create_vector_store(previous_modules_key, [entry for batch in batches for entry in batch])
+
+    @abstractmethod
+    def _index(self, previous_modules_key: str, entries: list[EmbeddedElement], matrix: np.ndarray):
+        """Indexes the embeddings of all entries. Row i of matrix belongs to entries[i]."""
+        ...
+
+    @abstractmethod
+    def _search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the positions in compare_indices and the distances of at least the k nearest compared elements."""
+        ...
+
+    def _search_many(self, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Returns the result of _search for every row of queries. Subclasses may search all queries at once."""
+        return [self._search(query, k) for query in queries]
+
+    @abstractmethod
+    def _embedding(self, index: int) -> Embedding:
+        ...
+
+    def __n(self) -> int:
+        if self.use_dynamic_n:
+            return self.dynamic_max_n
+        return len(self.compare_indices) if self.n_results == self.N_ALL else self.n_results
+
+    def find_similar(self, query: Embedding) -> list[Element]:
+        elements, distances = self.find_similar_with_distances(query)
+        return elements
+
+    def find_similar_with_distances(self, query: Embedding) -> (list[Element], list[float]):
+        return self.__find_similar_many_with_distances([query])[0]
+
+    def find_similar_many(self, queries: list[Embedding]) -> list[list[Element]]:
+        return [elements for elements, distances in self.__find_similar_many_with_distances(queries)]
+
+    def __find_similar_many_with_distances(self,
+                                           queries: list[Embedding]) -> list[tuple[list[Element], list[float]]]:
+        if not queries:
+            return []
+        if len(self.compare_indices) == 0:
+            return [([], []) for _ in queries]
+        matrix = np.asarray([query.embedding for query in queries], dtype=np.float32).reshape(len(queries), -1)
+        selected = [self.__select(positions, distances)
+                    for positions, distances in self._search_many(matrix, self.__n())]
+        if self.use_dynamic_n:
+            counts = dynamic_n([[distance for distance, _ in results] for results in selected],
+                               self.dynamic_min_n, self.dynamic_max_n, self.dynamic_margin)
+            selected = [results[:count] for results, count in zip(selected, counts)]
+        return [([self.get_by_id(identifier) for _, identifier in results], [distance for distance, _ in results])
+                for results in selected]
+
+    def __select(self, positions: np.ndarray, distances: np.ndarray) -> list[tuple[float, str]]:
+        return sorted((float(distance), self.__elements[self.compare_indices[position]].identifier)
+                      for distance, position in zip(distances, positions) if distance <= self.threshold)[:self.__n()]
+
+    def get_by_id(self, identifier: str) -> Element:
+        return self.__elements[self.__indices[identifier]]
+
+    def get_by_parent_id(self, identifier: str) -> list[EmbeddedElement]:
+        return [EmbeddedElement(self.__elements[index], self._embedding(index))
+                for index in self.__children.get(identifier, [])]
+
+    def get_all_elements(self, compare: bool = False) -> list[EmbeddedElement]:
+        return [EmbeddedElement(element, self._embedding(index)) for index, element in enumerate(self.__elements)
+                if element.compare or not compare]
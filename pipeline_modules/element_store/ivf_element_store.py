@@ -0,0 +1,81 @@
+import math
+import os
+from hashlib import sha256, shake_128
+
+import numpy as np
+
+from .element_store import EmbeddedElement
+from .in_memory_element_store import InMemoryElementStore
+from .ivf_index import IVFIndex, fingerprint
+from ..embedding_creator.embedding_creator import Embedding
+from ..module import ModuleConfiguration
+
+
+class IVFElementStore(InMemoryElementStore):
+    """Approximate search with an inverted file index (see ivf_index.IVFIndex), for stores too large to scan.
+    n_lists defaults to 4 * sqrt(number of compared elements) and a query scans the nprobe nearest lists.
+    With pq_subspaces > 0 the lists hold product quantization codes and the rescore_factor * n_results nearest
+    candidates are re-ranked by their exact distance. The recall then depends mostly on rescore_factor:
+    on 20000 random 64-dimensional embeddings with 8 subspaces, recall@20 is about 0.53 with 4, 0.77 with 8
+    and 0.97 with 16 (see ivf_recall). With a path, the trained index is saved there and
+    reused as long as the compared embeddings and the index arguments are unchanged."""
+    __n_lists: int | None
+    __nprobe: int
+    __pq_subspaces: int
+    __rescore_factor: int
+    __iterations: int
+    __training_size: int | None
+    __seed: int
+
+    __embeddings: list[Embedding]
+    __matrix: np.ndarray
+    __index: IVFIndex
+
+    def __init__(self, configuration: ModuleConfiguration):
+        super().__init__(configuration)
+        self.__n_lists = self.configuration.args.get("n_lists")
+        self.__nprobe = self.configuration.args.setdefault("nprobe", 16)
+        if self.__nprobe < 1:
+            raise ValueError(f"nprobe must be at least 1, got {self.__nprobe}")
+        self.__pq_subspaces = self.configuration.args.setdefault("pq_subspaces", 0)
+        self.__rescore_factor = self.configuration.args.setdefault("rescore_factor", 16)
+        self.__iterations = self.configuration.args.setdefault("kmeans_iterations", 20)
+        self.__training_size = self.configuration.args.get("training_size")
+        self.__seed = self.configuration.args.setdefault("seed", 0)
+
+    def __file_name(self, previous_modules_key: str) -> str:
+        hash = shake_128(previous_modules_key.encode())
+        hash.update(sha256((self.configuration.name + self.configuration.args["direction"]).encode()).digest())
+        return hash.hexdigest(31) + ".npz"
+
+    def _index(self, previous_modules_key: str, entries: list[EmbeddedElement], matrix: np.ndarray):
+        self.__embeddings = [entry.embedding for entry in entries]
+        self.__matrix = np.ascontiguousarray(matrix[self.compare_indices])
+        n_lists = self.__n_lists or max(1, round(4 * math.sqrt(len(self.__matrix))))
+        parameters = {"n_lists": n_lists, "pq_subspaces": self.__pq_subspaces, "iterations": self.__iterations,
+                      "training_size": self.__training_size, "seed": self.__seed}
+
+        path = None
+        if "path" in self.configuration.args:
+            os.makedirs(self.configuration.args["path"], exist_ok=True)
+            path = os.path.join(self.configuration.args["path"], self.__file_name(previous_modules_key))
+            if os.path.exists(path):
+                index = IVFIndex.load(path, self.__matrix, fingerprint(self.__matrix, parameters))
+                if index is not None:
+                    self.__index = index
+                    return
+
+        print(f"Training IVF index with {min(n_lists, len(self.__matrix))} lists on {len(self.__matrix)} embeddings")
+        self.__index = IVFIndex.build(self.__matrix, **parameters)
+        if path is not None:
+            self.__index.save(path)
+
+    def _search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self._search_many(query[None, :], k)[0]
+
+    def _search_many(self, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        return self.__index.search_many(queries, k, self.__nprobe, self.similarity_function,
+                                        self.__matrix, self.__rescore_factor)
+
+    def _embedding(self, index: int) -> Embedding:
+        return self.__embeddings[index]
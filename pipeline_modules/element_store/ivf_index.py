@@ -0,0 +1,182 @@
+import json
+import os
+from hashlib import sha256
+
+import numpy as np
+
+from .quantization import distances_from_dot, top_k
+
+# Centroids of every product quantization subspace, codes are stored as uint8
+PQ_CENTROIDS = 256
+# Bounds the distance matrix computed while assigning rows to centroids to about 64 MiB
+_ASSIGN_ELEMENTS = 2 ** 24
+
+
+def assign(data: np.ndarray, centroids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the nearest centroid (squared euclidean distance) of every row and the distance to it."""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(data), dtype=np.int64)
+    distances = np.empty(len(data), dtype=np.float32)
+    block_size = max(1, _ASSIGN_ELEMENTS // max(1, len(centroids)))
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        block_distances = centroid_norms - 2 * (block @ centroids.T)
+        assignments[start:start + block_size] = block_distances.argmin(axis=1)
+        distances[start:start + block_size] = np.maximum(
+            block_distances[np.arange(len(block)), assignments[start:start + block_size]]
+            + np.einsum("ij,ij->i", block, block), 0)
+    return assignments, distances
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means on the rows of data, initialized with k random rows.
+    Clusters that run empty are re-seeded with the rows farthest from their centroids."""
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments, distances = assign(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        order = np.argsort(assignments, kind="stable")
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[np.argsort(-distances, kind="stable")[:len(empty)]]
+    return centroids
+
+
+def fingerprint(matrix: np.ndarray, parameters: dict) -> str:
+    """Identifies an index by the indexed rows and the parameters it was trained with."""
+    hash = sha256(json.dumps(parameters, sort_keys=True).encode())
+    hash.update(str(matrix.shape).encode())
+    hash.update(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+    return hash.hexdigest()
+
+
+class IVFIndex:
+    """Inverted file index: the rows are partitioned by a k-means coarse quantizer into n_lists lists
+    and a query only scans the rows of the nprobe lists with the nearest centroids.
+    With pq_subspaces > 0, the residuals of the rows to their centroids are product quantized
+    into pq_subspaces uint8 codes and scanned with asymmetric distance computation (ADC):
+    the query is compared with every codebook once and a row costs pq_subspaces table lookups.
+    Distances follow the similarity function like in the chroma store."""
+    centroids: np.ndarray
+    # Row positions grouped by list, list i holds order[offsets[i]:offsets[i + 1]]
+    order: np.ndarray
+    offsets: np.ndarray
+    # (pq_subspaces, PQ_CENTROIDS, dimension / pq_subspaces) and one code per subspace for every ordered row
+    codebooks: np.ndarray | None
+    codes: np.ndarray | None
+    fingerprint: str
+
+    __vectors: np.ndarray | None
+    __squared_norms: np.ndarray
+    __centroid_squared_norms: np.ndarray
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                 codebooks: np.ndarray | None, codes: np.ndarray | None, fingerprint: str, matrix: np.ndarray):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.codebooks = codebooks
+        self.codes = codes
+        self.fingerprint = fingerprint
+        ordered = np.asarray(matrix[order], dtype=np.float32)
+        self.__squared_norms = np.einsum("ij,ij->i", ordered, ordered)
+        # Without product quantization the lists hold the rows themselves
+        self.__vectors = ordered if codes is None else None
+        self.__centroid_squared_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+    @staticmethod
+    def build(matrix: np.ndarray, n_lists: int, pq_subspaces: int = 0, iterations: int = 20,
+              training_size: int | None = None, seed: int = 0) -> "IVFIndex":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if pq_subspaces and matrix.shape[1] % pq_subspaces != 0:
+            raise ValueError(f"pq_subspaces {pq_subspaces} does not divide the embedding dimension {matrix.shape[1]}")
+        parameters = {"n_lists": n_lists, "pq_subspaces": pq_subspaces, "iterations": iterations,
+                      "training_size": training_size, "seed": seed}
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists, len(matrix)))
+        training_size = min(len(matrix), training_size or PQ_CENTROIDS * n_lists)
+        training = matrix[np.sort(rng.choice(len(matrix), size=training_size, replace=False))]
+
+        centroids = kmeans(training, n_lists, iterations, rng) if len(matrix) else np.zeros((1, matrix.shape[1]),
+                                                                                             dtype=np.float32)
+        assignments, _ = assign(matrix, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))))
+
+        codebooks = None
+        codes = None
+        if pq_subspaces and len(matrix):
+            training_residuals = training - centroids[assign(training, centroids)[0]]
+            residuals = matrix[order] - centroids[assignments[order]]
+            subspace = matrix.shape[1] // pq_subspaces
+            codebooks = np.zeros((pq_subspaces, PQ_CENTROIDS, subspace), dtype=np.float32)
+            codes = np.empty((len(matrix), pq_subspaces), dtype=np.uint8)
+            for index in range(pq_subspaces):
+                columns = slice(index * subspace, (index + 1) * subspace)
+                codebook = kmeans(np.ascontiguousarray(training_residuals[:, columns]), PQ_CENTROIDS, iterations, rng)
+                codebooks[index, :len(codebook)] = codebook
+                codes[:, index] = assign(np.ascontiguousarray(residuals[:, columns]), codebook)[0]
+        return IVFIndex(centroids, order, offsets, codebooks, codes, fingerprint(matrix, parameters), matrix)
+
+    def save(self, path: str):
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            arrays = {"centroids": self.centroids, "order": self.order, "offsets": self.offsets,
+                      "fingerprint": np.array(self.fingerprint)}
+            if self.codes is not None:
+                arrays["codebooks"] = self.codebooks
+                arrays["codes"] = self.codes
+            np.savez(file, **arrays)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def load(path: str, matrix: np.ndarray, expected_fingerprint: str) -> "IVFIndex | None":
+        """Loads a saved index of the rows of matrix, which are not saved with the index.
+        Returns None if the saved index has another fingerprint."""
+        with np.load(path) as arrays:
+            if str(arrays["fingerprint"]) != expected_fingerprint:
+                return None
+            return IVFIndex(arrays["centroids"], arrays["order"], arrays["offsets"],
+                            arrays["codebooks"] if "codebooks" in arrays else None,
+                            arrays["codes"] if "codes" in arrays else None, str(arrays["fingerprint"]), matrix)
+
+    def search_many(self, queries: np.ndarray, k: int, nprobe: int, similarity_function: str,
+                    matrix: np.ndarray | None = None, rescore_factor: int = 0) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Returns the row positions and distances of at least the k nearest rows in the probed lists of every query.
+        With product quantization, matrix and rescore_factor > 0, the rescore_factor * k nearest candidates
+        are re-ranked by their exact distance. nprobe is limited to the number of lists."""
+        if nprobe < 1:
+            raise ValueError(f"nprobe must be at least 1, got {nprobe}")
+        nprobe = min(nprobe, len(self.centroids))
+        queries = np.asarray(queries, dtype=np.float32)
+        centroid_products = queries @ self.centroids.T
+        lengths = np.diff(self.offsets)
+        results = list()
+        for query, products in zip(queries, centroid_products):
+            centroid_distances = distances_from_dot(products, self.__centroid_squared_norms, query,
+                                                    similarity_function)
+            candidates = top_k(centroid_distances, nprobe)
+            # top_k includes ties in no particular order, the nearest lists are probed, ties by their position
+            lists = candidates[np.argsort(centroid_distances[candidates], kind="stable")[:nprobe]]
+            rows = np.concatenate([np.arange(self.offsets[index], self.offsets[index + 1]) for index in lists])
+            if self.__vectors is not None:
+                row_products = self.__vectors[rows] @ query
+            else:
+                # ADC: dot products of the query with the centroids plus the quantized residuals
+                table = np.einsum("mcs,ms->mc", self.codebooks, query.reshape(len(self.codebooks), -1))
+                row_products = (np.repeat(products[lists], lengths[lists])
+                                + table[np.arange(len(table)), self.codes[rows]].sum(axis=1))
+            row_distances = distances_from_dot(row_products, self.__squared_norms[rows], query, similarity_function)
+
+            if self.__vectors is None and matrix is not None and rescore_factor > 0:
+                candidates = top_k(row_distances, k * rescore_factor)
+                rows = rows[candidates]
+                row_distances = distances_from_dot(np.asarray(matrix[self.order[rows]], dtype=np.float32) @ query,
+                                                   self.__squared_norms[rows], query, similarity_function)
+            nearest = top_k(row_distances, k)
+            results.append((self.order[rows[nearest]], row_distances[nearest]))
+        return results
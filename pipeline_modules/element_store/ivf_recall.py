@@ -0,0 +1,79 @@
+"""Reports the recall and latency of IVF search against exact search.
+
+Sampled embeddings are used as queries against all embeddings, for every nprobe the recall@k of the IVF index
+and the mean latency per query are compared with an exact search over all embeddings.
+Embeddings are read like in quantization_recall.
+
+Usage (from the repository root):
+    python -m pipeline_modules.element_store.ivf_recall --k 20 ./storage/teastore/embeddings/<namespace> --nprobe 1 4 16 64
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from .ivf_index import IVFIndex
+from .quantization import squared_norms, distances, top_k
+from .quantization_recall import load_embeddings
+
+
+def exact_search(matrix: np.ndarray, queries: np.ndarray, k: int, similarity_function: str) -> list[set[int]]:
+    norms = squared_norms(matrix, None)
+    results = list()
+    for query in queries:
+        query_distances = distances(query, matrix, None, norms, similarity_function)
+        nearest = top_k(query_distances, k)
+        results.append(set(nearest[np.argsort(query_distances[nearest], kind="stable")[:k]].tolist()))
+    return results
+
+
+def main(arguments: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m pipeline_modules.element_store.ivf_recall",
+                                     description="Reports the recall and latency of IVF search against exact search.")
+    parser.add_argument("--k", type=int, default=20, help="number of nearest neighbours")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled query embeddings")
+    parser.add_argument("--similarity-function", default="cosine", choices=["cosine", "l2", "ip"])
+    parser.add_argument("--n-lists", type=int, help="number of lists, 4 * sqrt(number of embeddings) by default")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="numbers of probed lists to report")
+    parser.add_argument("--pq-subspaces", type=int, default=0, help="product quantization subspaces, 0 disables")
+    parser.add_argument("--rescore-factor", type=int, default=16,
+                        help="candidates per result re-ranked with full precision when product quantization is used")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("embeddings", nargs="+", help="embedding cache folders or .npy files")
+    args = parser.parse_args(arguments)
+
+    for path in args.embeddings:
+        matrix = np.ascontiguousarray(load_embeddings(path), dtype=np.float32)
+        queries = matrix[np.random.default_rng(args.seed).choice(len(matrix), size=min(args.queries, len(matrix)),
+                                                                 replace=False)]
+        n_lists = args.n_lists or max(1, round(4 * math.sqrt(len(matrix))))
+        print(f"{path}: {matrix.shape[0]} embeddings of dimension {matrix.shape[1]}, {len(queries)} queries")
+
+        start = time.perf_counter()
+        expected = exact_search(matrix, queries, args.k, args.similarity_function)
+        exact_latency = (time.perf_counter() - start) / len(queries)
+        print(f"  exact: {exact_latency * 1000:.3f} ms per query")
+
+        start = time.perf_counter()
+        index = IVFIndex.build(matrix, n_lists, args.pq_subspaces, seed=args.seed)
+        print(f"  IVF index with {n_lists} lists"
+              f"{f' and {args.pq_subspaces} PQ subspaces' if args.pq_subspaces else ''} "
+              f"built in {time.perf_counter() - start:.1f} s")
+
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            results = index.search_many(queries, args.k, nprobe, args.similarity_function, matrix,
+                                        args.rescore_factor)
+            latency = (time.perf_counter() - start) / len(queries)
+            found = sum(len(relevant & set(positions[np.argsort(found_distances, kind="stable")[:args.k]].tolist()))
+                        for relevant, (positions, found_distances) in zip(expected, results))
+            expected_count = sum(len(relevant) for relevant in expected)
+            ivf_recall = found / expected_count if expected_count else 1.0
+            print(f"  nprobe {nprobe}: recall@{args.k} {ivf_recall:.4f}, {latency * 1000:.3f} ms per query "
+                  f"({exact_latency / latency if latency > 0 else math.inf:.1f}x exact)")
+
+
+if __name__ == '__main__':
+    main()
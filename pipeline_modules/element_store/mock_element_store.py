@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from .element_store import ElementStore, EmbeddedElement, Element, Embedding
 from ..module import ModuleConfiguration
 
@@ -11,9 +13,15 @@ class MockElementStore(ElementStore):
     def create_vector_store(self, previous_modules_key: str, entries: list[EmbeddedElement]):
         self.__elements = entries
 
+    def create_vector_store_from_batches(self, previous_modules_key: str, batches: Iterable[list[EmbeddedElement]]):
+        self.__elements = [entry for batch in batches for entry in batch]
+
     def find_similar(self, query: Embedding) -> list[Element]:
         return [element.element for element in self.__elements]
 
+    def find_similar_many(self, queries: list[Embedding]) -> list[list[Element]]:
+        return [self.find_similar(query) for query in queries]
+
     def get_by_parent_id(self, identifier: str) -> list[EmbeddedElement]:
         return [element for element in self.__elements if element.element.parent.identifier == identifier]
 
@@ -0,0 +1,50 @@
+import numpy as np
+
+from .element_store import EmbeddedElement
+from .in_memory_element_store import InMemoryElementStore
+from .quantization import top_k
+from ..embedding_creator.embedding_creator import Embedding
+
+
+class NumpyElementStore(InMemoryElementStore):
+    """Exact search over all compared embeddings with a single matrix-vector product per query.
+    For cosine similarity the embeddings are normalized once when the store is created."""
+    __embeddings: list[Embedding]
+    __matrix: np.ndarray
+    __squared_norms: np.ndarray
+
+    def _index(self, previous_modules_key: str, entries: list[EmbeddedElement], matrix: np.ndarray):
+        self.__embeddings = [entry.embedding for entry in entries]
+        self.__matrix = np.ascontiguousarray(matrix[self.compare_indices])
+        if self.similarity_function == "cosine":
+            norms = np.linalg.norm(self.__matrix, axis=1, keepdims=True)
+            self.__matrix /= np.where(norms > 0, norms, 1)
+        self.__squared_norms = np.einsum("ij,ij->i", self.__matrix, self.__matrix)
+
+    def __distances(self, queries: np.ndarray) -> np.ndarray:
+        """Distances between every query row and every compared embedding, computed with one matrix product."""
+        if self.similarity_function == "cosine":
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            return 1 - (queries / np.where(query_norms > 0, query_norms, 1)) @ self.__matrix.T
+        if self.similarity_function == "l2":
+            query_squared_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+            return np.maximum(self.__squared_norms + query_squared_norms - 2 * (queries @ self.__matrix.T), 0)
+        if self.similarity_function == "ip":
+            return 1 - queries @ self.__matrix.T
+        raise ValueError(f"Unknown similarity function {self.similarity_function}, expected cosine, l2 or ip")
+
+    def _search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self._search_many(query[None, :], k)[0]
+
+    def _search_many(self, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        results = list()
+        # Bounds the distance matrix of a block to about 64 MiB
+        block_size = max(1, 2 ** 24 // max(1, len(self.__matrix)))
+        for start in range(0, len(queries), block_size):
+            for distances in self.__distances(queries[start:start + block_size]):
+                positions = top_k(distances, k)
+                results.append((positions, distances[positions]))
+        return results
+
+    def _embedding(self, index: int) -> Embedding:
+        return self.__embeddings[index]
@@ -0,0 +1,77 @@
+import numpy as np
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+# Rows multiplied at once while searching int8 codes, bounds the temporary float32 copy
+BLOCK_SIZE = 8192
+
+
+def quantize(matrix: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Returns the quantized rows and, for int8, the scale of each row.
+    int8 codes are symmetric: a row is approximately codes * scale with scale = max(|row|) / 127."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if quantization == "float32":
+        return matrix, None
+    if quantization == "float16":
+        return matrix.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127 if len(matrix) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1).astype(np.float32)
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unknown quantization {quantization}, expected one of {', '.join(QUANTIZATIONS)}")
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    if scales is None:
+        return np.asarray(codes, dtype=np.float32)
+    return codes.astype(np.float32) * scales[..., None]
+
+
+def dot(query: np.ndarray, codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    """Dot products of the query with all quantized rows, computed block by block."""
+    query = np.asarray(query, dtype=np.float32)
+    products = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_SIZE):
+        block = codes[start:start + BLOCK_SIZE].astype(np.float32) @ query
+        products[start:start + BLOCK_SIZE] = block * scales[start:start + BLOCK_SIZE] if scales is not None else block
+    return products
+
+
+def squared_norms(codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    norms = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_SIZE):
+        block_scales = None if scales is None else scales[start:start + BLOCK_SIZE]
+        block = dequantize(codes[start:start + BLOCK_SIZE], block_scales)
+        norms[start:start + BLOCK_SIZE] = np.einsum("ij,ij->i", block, block)
+    return norms
+
+
+def distances_from_dot(products: np.ndarray, row_squared_norms: np.ndarray, query: np.ndarray,
+                       similarity_function: str) -> np.ndarray:
+    """Converts dot products into the distances Chroma reports for its hnsw:space:
+    cosine is 1 - cosine similarity, l2 the squared euclidean distance and ip 1 - dot product."""
+    query = np.asarray(query, dtype=np.float32)
+    if similarity_function == "cosine":
+        norms = np.sqrt(row_squared_norms) * np.linalg.norm(query)
+        return 1 - products / np.where(norms > 0, norms, 1)
+    if similarity_function == "l2":
+        return np.maximum(row_squared_norms + np.dot(query, query) - 2 * products, 0)
+    if similarity_function == "ip":
+        return 1 - products
+    raise ValueError(f"Unknown similarity function {similarity_function}, expected cosine, l2 or ip")
+
+
+def distances(query: np.ndarray, codes: np.ndarray, scales: np.ndarray | None, row_squared_norms: np.ndarray,
+              similarity_function: str) -> np.ndarray:
+    return distances_from_dot(dot(query, codes, scales), row_squared_norms, query, similarity_function)
+
+
+def top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k smallest distances in no particular order.
+    All positions tied with the k-th distance are included, so callers can break ties deterministically."""
+    if k >= len(distances):
+        return np.arange(len(distances))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth = np.partition(distances, k - 1)[k - 1]
+    return np.flatnonzero(distances <= kth)
@@ -0,0 +1,85 @@
+"""Reports the recall of quantized search against full precision search.
+
+Every sampled embedding is used as a query against all other embeddings. Embeddings are read from
+memory-mapped embedding caches (cache_backend "mmap") or from .npy files written by the quantized element store.
+
+Usage (from the repository root):
+    python -m pipeline_modules.element_store.quantization_recall --k 20 ./storage/teastore/embeddings/<namespace>
+"""
+import argparse
+import os
+
+import numpy as np
+
+from .quantization import QUANTIZATIONS, quantize, squared_norms, distances
+from ..embedding_creator.memory_mapped_embedding_store import MemoryMappedEmbeddingStore
+
+
+def load_embeddings(path: str) -> np.ndarray:
+    if os.path.isdir(path):
+        store = MemoryMappedEmbeddingStore(path)
+        matrix = store.matrix()
+        scales = store.scales()
+        return np.asarray(matrix, dtype=np.float32) * (scales[:, None] if scales is not None else 1)
+    return np.load(path, mmap_mode="r")
+
+
+def nearest(distances_to_query: np.ndarray, k: int) -> set[int]:
+    k = min(k, len(distances_to_query) - 1)
+    return set(np.argpartition(distances_to_query, k)[:k].tolist()) if k > 0 else set()
+
+
+def recall(matrix: np.ndarray, quantization: str, k: int, queries: np.ndarray, similarity_function: str,
+           rescore_factor: int) -> float:
+    """Share of the exact k nearest neighbours of the queries that the quantized search returns."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    codes, scales = quantize(matrix, quantization)
+    norms = squared_norms(codes, scales)
+    exact_norms = squared_norms(matrix, None)
+    found = 0
+    expected = 0
+    for query in queries:
+        exact = distances(matrix[query], matrix, None, exact_norms, similarity_function)
+        exact[query] = np.inf
+        approximate = distances(matrix[query], codes, scales, norms, similarity_function)
+        approximate[query] = np.inf
+        if rescore_factor > 0:
+            candidates = np.array(sorted(nearest(approximate, k * rescore_factor)), dtype=np.int64)
+            approximate = np.full(len(matrix), np.inf, dtype=np.float32)
+            approximate[candidates] = exact[candidates]
+        relevant = nearest(exact, k)
+        found += len(relevant & nearest(approximate, k))
+        expected += len(relevant)
+    return found / expected if expected else 1.0
+
+
+def main(arguments: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m pipeline_modules.element_store.quantization_recall",
+                                     description="Reports the recall of quantized search against full precision.")
+    parser.add_argument("--k", type=int, default=20, help="number of nearest neighbours")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled query embeddings")
+    parser.add_argument("--similarity-function", default="cosine", choices=["cosine", "l2", "ip"])
+    parser.add_argument("--rescore-factor", type=int, default=4,
+                        help="candidates per result re-ranked with full precision")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("embeddings", nargs="+", help="embedding cache folders or .npy files")
+    args = parser.parse_args(arguments)
+
+    for path in args.embeddings:
+        matrix = load_embeddings(path)
+        queries = np.random.default_rng(args.seed).choice(len(matrix), size=min(args.queries, len(matrix)),
+                                                          replace=False)
+        print(f"{path}: {matrix.shape[0]} embeddings of dimension {matrix.shape[1]}, {len(queries)} queries")
+        for quantization in QUANTIZATIONS[1:]:
+            codes, scales = quantize(matrix[:1], quantization)
+            row_bytes = codes.nbytes + (scales.nbytes if scales is not None else 0)
+            quantized_recall = recall(matrix, quantization, args.k, queries, args.similarity_function, 0)
+            rescored_recall = recall(matrix, quantization, args.k, queries, args.similarity_function,
+                                     args.rescore_factor)
+            print(f"  {quantization}: {row_bytes / (matrix.shape[1] * 4):.0%} of float32 memory, "
+                  f"recall@{args.k} {quantized_recall:.4f} (delta {quantized_recall - 1:+.4f}), "
+                  f"with rescoring {rescored_recall:.4f} (delta {rescored_recall - 1:+.4f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+from hashlib import sha256, shake_128
+
+import numpy as np
+
+from .element_store import EmbeddedElement
+from .in_memory_element_store import InMemoryElementStore
+from .quantization import quantize, squared_norms, distances, top_k
+from ..embedding_creator.embedding_creator import Embedding
+from ..module import ModuleConfiguration
+
+
+class QuantizedElementStore(InMemoryElementStore):
+    """Keeps the elements in memory with float16 or int8 embeddings (int8 with a scale per vector).
+    The full precision embeddings are written to a memory-mapped file in path. With rescore_factor > 0,
+    the rescore_factor * n_results nearest candidates of the quantized search are re-ranked by their exact distance.
+    Distances follow the similarity function like in the chroma store."""
+    __quantization: str
+    __rescore_factor: int
+
+    __codes: np.ndarray
+    __scales: np.ndarray | None
+    __squared_norms: np.ndarray
+    __full_precision: np.ndarray
+
+    def __init__(self, configuration: ModuleConfiguration):
+        super().__init__(configuration)
+        self.__quantization = self.configuration.args.setdefault("quantization", "int8")
+        self.__rescore_factor = self.configuration.args.setdefault("rescore_factor", 4)
+
+    def __file_name(self, previous_modules_key: str) -> str:
+        hash = shake_128(previous_modules_key.encode())
+        hash.update(sha256((self.configuration.name + self.configuration.args["direction"]).encode()).digest())
+        return hash.hexdigest(31) + ".npy"
+
+    def _index(self, previous_modules_key: str, entries: list[EmbeddedElement], matrix: np.ndarray):
+        # Only the quantized embeddings are kept in memory
+        os.makedirs(self.configuration.args["path"], exist_ok=True)
+        path = os.path.join(self.configuration.args["path"], self.__file_name(previous_modules_key))
+        full_precision = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=matrix.shape)
+        full_precision[:] = matrix
+        full_precision.flush()
+        del full_precision
+        self.__full_precision = np.load(path, mmap_mode="r")
+
+        self.__codes, self.__scales = quantize(matrix[self.compare_indices], self.__quantization)
+        self.__squared_norms = squared_norms(self.__codes, self.__scales)
+
+    def _search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        candidate_distances = distances(query, self.__codes, self.__scales, self.__squared_norms,
+                                        self.similarity_function)
+        if self.__rescore_factor <= 0:
+            candidates = top_k(candidate_distances, k)
+            return candidates, candidate_distances[candidates]
+        candidates = top_k(candidate_distances, k * self.__rescore_factor)
+        exact = np.asarray(self.__full_precision[self.compare_indices[candidates]])
+        return candidates, distances(query, exact, None, squared_norms(exact, None), self.similarity_function)
+
+    def _embedding(self, index: int) -> Embedding:
+        """Returns the full precision embedding, which is read from the memory-mapped file."""
+        return Embedding(self.__full_precision[index].tolist())
+
+    def memory_statistics(self) -> dict[str, int]:
+        """Bytes of the quantized embeddings held in memory and of their full precision counterparts on disk."""
+        quantized = self.__codes.nbytes + (self.__scales.nbytes if self.__scales is not None else 0)
+        return {"quantized_bytes": quantized, "full_precision_bytes": self.__full_precision.nbytes}
@@ -0,0 +1,67 @@
+import re
+from hashlib import sha256
+from typing import Iterable, Iterator
+
+from cache.lru_cache import LRUCache
+from .embedding_creator import EmbeddingCreator, Element, Embedding
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_content(content: str) -> str:
+    """Contents differing only in whitespace are embedded once."""
+    return WHITESPACE_PATTERN.sub(" ", content).strip()
+
+
+def content_key(content: str) -> bytes:
+    return sha256(normalize_content(content).encode()).digest()
+
+
+class DeduplicatingEmbeddingCreator(EmbeddingCreator):
+    """Embeds each distinct normalized content of a call once and shares its embedding between all elements with that
+    content. Embeddings of earlier calls, e.g. of the targets for the sources of the same run, are reused while they are
+    among the max_entries most recently used contents, which are keyed by the hash of the content."""
+    __embedding_creator: EmbeddingCreator
+    __embeddings: LRUCache
+
+    def __init__(self, embedding_creator: EmbeddingCreator, max_entries: int = 100000):
+        self.__embedding_creator = embedding_creator
+        self.__embeddings = LRUCache(max_entries=max_entries)
+
+    def requires_fit(self) -> bool:
+        return self.__embedding_creator.requires_fit()
+
+    def fit(self, elements: Iterable[Element]):
+        # Fitted on the distinct contents, like the wrapped creator sees them when embedding
+        def distinct() -> Iterator[Element]:
+            seen = set()
+            for element in elements:
+                key = content_key(element.content)
+                if key not in seen:
+                    seen.add(key)
+                    yield element
+
+        self.__embedding_creator.fit(distinct())
+
+    def calculate_embedding(self, element: Element) -> Embedding:
+        return self.calculate_multiple_embeddings([element])[0]
+
+    def calculate_multiple_embeddings(self, elements: list[Element]) -> list[Embedding]:
+        keys = [content_key(element.content) for element in elements]
+        embeddings = dict()
+        # The first element of each new content is embedded for all elements with that content
+        missing = dict()
+        for key, element in zip(keys, elements):
+            if key not in embeddings and key not in missing:
+                embedding = self.__embeddings.get(key)
+                if embedding is None:
+                    missing[key] = element
+                else:
+                    embeddings[key] = embedding
+        if missing:
+            for key, embedding in zip(missing, self.__embedding_creator.calculate_multiple_embeddings(
+                    list(missing.values()))):
+                embeddings[key] = embedding
+                self.__embeddings.put(key, embedding)
+        print(f"Embedded {len(missing)} distinct contents for {len(elements)} elements")
+        return [embeddings[key] for key in keys]
@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from langchain_core.embeddings import Embeddings
+
+from ..token_bucket import TokenBucket
+
+
+def token_counter(model: str) -> Callable[[str], int]:
+    """Counts tokens with tiktoken if it is installed, otherwise estimates four characters per token."""
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: len(text) // 4 + 1
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class EmbeddingBatchScheduler(Embeddings):
+    """Sends the texts of an embed_documents call to an embedding model in batches.
+
+    Batches are limited by max_batch_tokens and max_batch_size. Up to max_concurrency batches are sent at once,
+    while at most tokens_per_minute tokens are sent per minute. Batches failing with one of the retryable
+    exceptions are retried up to max_retries times after a jittered exponential backoff."""
+    __embedding_model: Embeddings
+    __count_tokens: Callable[[str], int]
+    __max_batch_tokens: int
+    __max_batch_size: int
+    __max_concurrency: int
+    __max_retries: int
+    __initial_backoff: float
+    __max_backoff: float
+    __retryable: tuple[type[BaseException], ...]
+    __bucket: TokenBucket
+    __retries: int
+    __retries_lock: threading.Lock
+
+    def __init__(self, embedding_model: Embeddings, count_tokens: Callable[[str], int],
+                 retryable: tuple[type[BaseException], ...], max_batch_tokens: int = 250000,
+                 max_batch_size: int = 2048, tokens_per_minute: int = 1000000, max_concurrency: int = 4,
+                 max_retries: int = 8, initial_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.__embedding_model = embedding_model
+        self.__count_tokens = count_tokens
+        self.__retryable = retryable
+        self.__max_batch_tokens = max_batch_tokens
+        self.__max_batch_size = max_batch_size
+        self.__max_concurrency = max_concurrency
+        self.__max_retries = max_retries
+        self.__initial_backoff = initial_backoff
+        self.__max_backoff = max_backoff
+        self.__bucket = TokenBucket(tokens_per_minute)
+        self.__retries = 0
+        self.__retries_lock = threading.Lock()
+
+    def batches(self, texts: list[str]) -> list[tuple[list[int], int]]:
+        """Splits the texts into batches of consecutive indices. Returns the indices and the tokens of each batch.
+        A text longer than max_batch_tokens forms a batch of its own."""
+        batches = []
+        indices = []
+        tokens = 0
+        for index, text in enumerate(texts):
+            text_tokens = self.__count_tokens(text)
+            if indices and (tokens + text_tokens > self.__max_batch_tokens or len(indices) >= self.__max_batch_size):
+                batches.append((indices, tokens))
+                indices = []
+                tokens = 0
+            indices.append(index)
+            tokens += text_tokens
+        if indices:
+            batches.append((indices, tokens))
+        return batches
+
+    def __embed_batch(self, texts: list[str], tokens: int) -> list[list[float]]:
+        for attempt in range(self.__max_retries + 1):
+            self.__bucket.acquire(tokens)
+            try:
+                return self.__embedding_model.embed_documents(texts)
+            except self.__retryable as e:
+                if attempt == self.__max_retries:
+                    raise
+                backoff = min(self.__max_backoff, self.__initial_backoff * 2 ** attempt)
+                # Full jitter keeps concurrent batches from retrying at the same moment
+                backoff = random.uniform(0, backoff)
+                print(f"Embedding batch of {len(texts)} texts failed ({type(e).__name__}), "
+                      f"retrying in {backoff:.1f}s")
+                with self.__retries_lock:
+                    self.__retries += 1
+                time.sleep(backoff)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        retries = self.__retries
+        batches = self.batches(texts)
+        with ThreadPoolExecutor(max_workers=min(self.__max_concurrency, len(batches))) as executor:
+            results = list(executor.map(lambda batch: self.__embed_batch([texts[i] for i in batch[0]], batch[1]),
+                                        batches))
+        embeddings = [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+        duration = max(time.perf_counter() - start, 1e-9)
+        tokens = sum(batch_tokens for _, batch_tokens in batches)
+        print(f"Embedded {len(texts)} texts ({tokens} tokens) in {len(batches)} batches in {duration:.1f}s: "
+              f"{len(texts) / duration:.1f} texts/s, {tokens * 60 / duration:.0f} tokens/min, "
+              f"{self.__retries - retries} retries")
+        return embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
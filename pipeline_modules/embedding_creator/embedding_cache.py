@@ -0,0 +1,37 @@
+import json
+import os
+from hashlib import shake_128
+
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+
+from .memory_mapped_embedding_store import MemoryMappedCacheBackedEmbeddings, MemoryMappedEmbeddingStore
+from ..module import ModuleConfiguration
+
+# Arguments that choose where embeddings are cached and how requests are scheduled.
+# They do not change the embeddings, so they are not part of the cache namespace.
+NAMESPACE_EXCLUDED_ARGUMENTS = ("path", "cache_backend", "cache_dtype", "scheduler")
+
+
+def cache_namespace(configuration: ModuleConfiguration) -> str:
+    hash = shake_128(configuration.name.encode())
+    args = {key: value for key, value in configuration.args.items() if key not in NAMESPACE_EXCLUDED_ARGUMENTS}
+    hash.update(json.dumps(args, sort_keys=True).encode())
+    return hash.hexdigest(31)
+
+
+def build_cached_embedder(embedding_model: Embeddings, configuration: ModuleConfiguration) -> Embeddings:
+    """Wraps the embedding model with the cache chosen by the cache_backend argument:
+    "file" stores every embedding in its own file of a LocalFileStore,
+    "mmap" stores all embeddings of the namespace in one memory-mapped matrix of cache_dtype (float32, float16 or int8)."""
+    path = configuration.args.get("path", "./storage/embeddings/")
+    backend = configuration.args.get("cache_backend", "file")
+    namespace = cache_namespace(configuration)
+    if backend == "file":
+        return CacheBackedEmbeddings.from_bytes_store(embedding_model, LocalFileStore(path), namespace=namespace)
+    if backend == "mmap":
+        store = MemoryMappedEmbeddingStore(os.path.join(path, namespace),
+                                           dtype=configuration.args.get("cache_dtype", "float32"))
+        return MemoryMappedCacheBackedEmbeddings(embedding_model, store)
+    raise ValueError(f"Unknown embedding cache backend {backend}, expected file or mmap")
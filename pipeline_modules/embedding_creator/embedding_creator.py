@@ -1,4 +1,4 @@
-from typing import Protocol, Any
+from typing import Any, Iterable, Protocol
 
 from ..knowledge import Element
 from ..module import ModuleConfiguration
@@ -14,6 +14,15 @@ class Embedding:
 
 
 class EmbeddingCreator(Protocol):
+    def requires_fit(self) -> bool:
+        """Whether the embeddings depend on a corpus, which has to be passed to fit before embedding."""
+        ...
+
+    def fit(self, elements: Iterable[Element]):
+        """Learns the corpus statistics (e.g. a vocabulary) the embeddings of all later elements are based on.
+        The elements are iterated once, so they can be streamed."""
+        ...
+
     def calculate_embedding(self, element: Element) -> Embedding:
         ...
 
@@ -25,11 +34,13 @@ class EmbeddingCreatorBuilder:
     from .mock_embedding_creator import MockEmbeddingCreator
     from .openai_embedding_creator import OpenAIEmbeddingCreator
     from .ollama_embedding_creator import OLLAMAEmbeddingCreator
+    from .tfidf_embedding_creator import TfidfEmbeddingCreator
 
     EMBEDDING_CREATORS = {
         'mock': MockEmbeddingCreator,
         'open_ai': OpenAIEmbeddingCreator,
-        'ollama': OLLAMAEmbeddingCreator
+        'ollama': OLLAMAEmbeddingCreator,
+        'tfidf': TfidfEmbeddingCreator
     }
 
     def build_embedding_creator(self, configuration: ModuleConfiguration) -> EmbeddingCreator:
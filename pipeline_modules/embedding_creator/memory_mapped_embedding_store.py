@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+from hashlib import sha256
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..element_store.quantization import quantize, dequantize
+
+
+class MemoryMappedEmbeddingStore:
+    """Stores the embeddings of one namespace as rows of a single matrix file, which is memory-mapped for reading.
+
+    The folder contains the matrix, an append-only file of the row keys (one per line) and the dtype and dimension.
+    int8 matrices additionally store the scale of every row.
+    New embeddings are appended, existing rows are never rewritten. Rows are written before their keys,
+    so an interrupted append leaves at most rows without keys, which are overwritten by the next append.
+    Several threads can share a store, but only one process may write to it at a time."""
+    KEYS = "keys.txt"
+    VECTORS = "vectors.bin"
+    SCALES = "scales.bin"
+    METADATA = "metadata.json"
+
+    __folder_path: str
+    __dtype: np.dtype
+    __dimension: int | None
+    __rows: dict[str, int]
+    __matrix: np.ndarray | None
+    __scales: np.ndarray | None
+    __lock: threading.RLock
+
+    def __init__(self, folder_path: str, dtype: str = "float32"):
+        """dtype is float32, float16 or int8. It is only used for new stores, existing stores keep their dtype."""
+        self.__folder_path = folder_path
+        self.__lock = threading.RLock()
+        self.__matrix = None
+        self.__scales = None
+        os.makedirs(folder_path, exist_ok=True)
+
+        metadata_path = os.path.join(folder_path, self.METADATA)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            self.__dtype = np.dtype(metadata["dtype"])
+            self.__dimension = metadata["dimension"]
+        else:
+            if dtype not in ("float32", "float16", "int8"):
+                raise ValueError(f"Unsupported embedding dtype {dtype}, expected float32, float16 or int8")
+            self.__dtype = np.dtype(dtype)
+            self.__dimension = None
+
+        self.__rows = dict()
+        keys_path = os.path.join(folder_path, self.KEYS)
+        if os.path.exists(keys_path):
+            with open(keys_path) as file:
+                # The text after the last line break is incomplete if an append was interrupted
+                keys = file.read().split("\n")[:-1]
+            self.__rows = {key: row for row, key in enumerate(keys)}
+            if len(self.__rows) > self.__stored_rows():
+                raise ValueError(f"Embedding store {folder_path} has more keys than rows")
+
+    @staticmethod
+    def is_store(folder_path: str) -> bool:
+        return os.path.exists(os.path.join(folder_path, MemoryMappedEmbeddingStore.METADATA))
+
+    @staticmethod
+    def key(text: str) -> str:
+        return sha256(text.encode()).hexdigest()
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.__dtype
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__rows
+
+    def keys(self) -> list[str]:
+        with self.__lock:
+            return list(self.__rows)
+
+    def __row_bytes(self) -> int:
+        return self.__dimension * self.__dtype.itemsize
+
+    def __quantized(self) -> bool:
+        return self.__dtype == np.int8
+
+    def __stored_rows(self) -> int:
+        vectors_path = os.path.join(self.__folder_path, self.VECTORS)
+        if self.__dimension is None or not os.path.exists(vectors_path):
+            return 0
+        return os.path.getsize(vectors_path) // self.__row_bytes()
+
+    def matrix(self) -> np.ndarray:
+        """Returns all rows with a key as a read-only memory-mapped matrix. Row i belongs to the i-th key.
+        Rows of int8 stores are scaled by scales()."""
+        with self.__lock:
+            rows = len(self.__rows)
+            if self.__matrix is None or len(self.__matrix) != rows:
+                if rows == 0:
+                    self.__matrix = np.empty((0, self.__dimension or 0), dtype=self.__dtype)
+                    self.__scales = np.empty(0, dtype=np.float32)
+                else:
+                    self.__matrix = np.memmap(os.path.join(self.__folder_path, self.VECTORS), dtype=self.__dtype,
+                                              mode="r", shape=(rows, self.__dimension))
+                    if self.__quantized():
+                        self.__scales = np.memmap(os.path.join(self.__folder_path, self.SCALES), dtype=np.float32,
+                                                  mode="r", shape=(rows,))
+            return self.__matrix
+
+    def scales(self) -> np.ndarray | None:
+        """Returns the scale of every row of an int8 store, None for float stores."""
+        with self.__lock:
+            self.matrix()
+            return self.__scales if self.__quantized() else None
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """Returns the stored row of each key, or None if the key is not stored.
+        Rows of float stores are not copied, rows of int8 stores are dequantized."""
+        with self.__lock:
+            rows = [self.__rows.get(key) for key in keys]
+            matrix = self.matrix()
+            scales = self.scales()
+        if scales is not None:
+            return [dequantize(matrix[row], scales[row]) if row is not None else None for row in rows]
+        return [matrix[row] if row is not None else None for row in rows]
+
+    def put_many(self, keys: list[str], vectors: list[list[float]] | np.ndarray):
+        """Appends the vectors of keys that are not stored yet."""
+        with self.__lock:
+            new = dict()
+            for key, vector in zip(keys, vectors):
+                if key not in self.__rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            matrix, scales = quantize(np.asarray(list(new.values()), dtype=np.float32), self.__dtype.name)
+            if self.__dimension is None:
+                self.__dimension = matrix.shape[1]
+                with open(os.path.join(self.__folder_path, self.METADATA), "w") as file:
+                    json.dump({"dtype": self.__dtype.name, "dimension": self.__dimension}, file)
+            elif matrix.shape[1] != self.__dimension:
+                raise ValueError(f"Embeddings have dimension {matrix.shape[1]}, "
+                                 f"but the store {self.__folder_path} contains dimension {self.__dimension}")
+
+            self.__append(self.VECTORS, len(self.__rows) * self.__row_bytes(), matrix)
+            if scales is not None:
+                self.__append(self.SCALES, len(self.__rows) * scales.itemsize, scales)
+            with open(os.path.join(self.__folder_path, self.KEYS), "a") as file:
+                file.write("".join(key + "\n" for key in new))
+            for key in new:
+                self.__rows[key] = len(self.__rows)
+
+    def __append(self, file_name: str, offset: int, data: np.ndarray):
+        path = os.path.join(self.__folder_path, file_name)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+            # Drops data of an interrupted append
+            file.seek(offset)
+            file.truncate()
+            file.write(data.tobytes())
+
+
+class MemoryMappedCacheBackedEmbeddings(Embeddings):
+    """Caches the embeddings of an embedding model in a MemoryMappedEmbeddingStore.
+    All cached embeddings of a call are looked up at once and only the missing texts are embedded."""
+    __embedding_model: Embeddings
+    __store: MemoryMappedEmbeddingStore
+
+    def __init__(self, embedding_model: Embeddings, store: MemoryMappedEmbeddingStore):
+        self.__embedding_model = embedding_model
+        self.__store = store
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [MemoryMappedEmbeddingStore.key(text) for text in texts]
+        vectors = self.__store.get_many(keys)
+        missing = list({key: text for key, text, vector in zip(keys, texts, vectors) if vector is None}.items())
+        if missing:
+            self.__store.put_many([key for key, _ in missing],
+                                  self.__embedding_model.embed_documents([text for _, text in missing]))
+            vectors = self.__store.get_many(keys)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from .embedding_creator import EmbeddingCreator, Embedding, Element, ModuleConfiguration
 
 
@@ -6,6 +8,12 @@ class MockEmbeddingCreator(EmbeddingCreator):
     def __init__(self, configuration: ModuleConfiguration):
         pass
 
+    def requires_fit(self) -> bool:
+        return False
+
+    def fit(self, elements: Iterable[Element]):
+        pass
+
     def calculate_embedding(self, element: Element) -> Embedding:
         return Embedding(embedding=[0.0])
 
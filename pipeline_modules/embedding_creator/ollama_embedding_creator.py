@@ -1,14 +1,12 @@
-import json
 import os
 from base64 import b64encode
-from hashlib import shake_128
+from typing import Iterable
 
 import dotenv
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain_core.embeddings import Embeddings
 
+from .embedding_cache import build_cached_embedder
 from .embedding_creator import EmbeddingCreator, Element, Embedding
 from ..module import ModuleConfiguration
 
@@ -17,8 +15,6 @@ class OLLAMAEmbeddingCreator(EmbeddingCreator):
     __embedder: Embeddings
 
     def __init__(self, configuration: ModuleConfiguration):
-        store = LocalFileStore(configuration.args.setdefault("path", "./storage/embeddings/"))
-        configuration.args.pop("path")
         dotenv.load_dotenv()
 
         host = os.environ.get("OLLAMA_HOST")
@@ -32,12 +28,13 @@ class OLLAMAEmbeddingCreator(EmbeddingCreator):
         embedding_model = OllamaEmbeddings(base_url=host,
                                            model=configuration.args.setdefault("model", "nomic-embed-text:v1.5"),
                                            headers=headers)
-        hash = shake_128(configuration.name.encode())
-        hash.update(json.dumps(configuration.args, sort_keys=True).encode())
-        namespace = hash.hexdigest(31)
+        self.__embedder = build_cached_embedder(embedding_model, configuration)
 
-        self.__embedder = CacheBackedEmbeddings.from_bytes_store(
-            embedding_model, store, namespace=namespace)
+    def requires_fit(self) -> bool:
+        return False
+
+    def fit(self, elements: Iterable[Element]):
+        pass
 
     def calculate_embedding(self, element: Element) -> Embedding:
         print("Embedding: " + element.identifier)
@@ -1,13 +1,11 @@
-import json
-import time
-from hashlib import shake_128
+from typing import Iterable
 
 import openai
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_core.embeddings import Embeddings
 
+from .embedding_batch_scheduler import EmbeddingBatchScheduler, token_counter
+from .embedding_cache import build_cached_embedder
 from .embedding_creator import EmbeddingCreator, Element, Embedding
 from ..module import ModuleConfiguration
 
@@ -16,23 +14,24 @@ class OpenAIEmbeddingCreator(EmbeddingCreator):
     __embedder: Embeddings
 
     def __init__(self, configuration: ModuleConfiguration):
-        store = LocalFileStore(configuration.args.setdefault("path", "./storage/embeddings/"))
-        configuration.args.pop("path")
-        embedding_model = OpenAIEmbeddings(model=configuration.args.setdefault("model", "text-embedding-ada-002"))
-        hash = shake_128(configuration.name.encode())
-        hash.update(json.dumps(configuration.args, sort_keys=True).encode())
-        namespace = hash.hexdigest(31)
+        model = configuration.args.setdefault("model", "text-embedding-ada-002")
+        # Retries are left to the scheduler, which backs off across all concurrent batches
+        embedding_model = EmbeddingBatchScheduler(
+            OpenAIEmbeddings(model=model, max_retries=0), count_tokens=token_counter(model),
+            retryable=(openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                       openai.InternalServerError),
+            **configuration.args.get("scheduler", {}))
+        self.__embedder = build_cached_embedder(embedding_model, configuration)
 
-        self.__embedder = CacheBackedEmbeddings.from_bytes_store(
-            embedding_model, store, namespace=namespace)
+    def requires_fit(self) -> bool:
+        return False
+
+    def fit(self, elements: Iterable[Element]):
+        pass
 
     def calculate_embedding(self, element: Element) -> Embedding:
         print("Embedding: " + element.identifier)
-        try:
-            embedding = Embedding(self.__embedder.embed_documents([element.content])[0])
-        except openai.RateLimitError as e:
-            time.sleep(60)
-            embedding = Embedding(self.__embedder.embed_documents([element.content])[0])
+        embedding = Embedding(self.__embedder.embed_documents([element.content])[0])
         return embedding
 
     def calculate_multiple_embeddings(self, elements: list[Element]) -> list[Embedding]:
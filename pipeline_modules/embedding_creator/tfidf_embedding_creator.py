@@ -0,0 +1,112 @@
+import itertools
+import re
+import threading
+from typing import Iterable
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import Normalizer
+
+from .embedding_creator import EmbeddingCreator, Element, Embedding
+from ..module import ModuleConfiguration
+
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9]*|\d+")
+# Splits camelCase, PascalCase and acronyms like HTTPServer into their parts
+IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def identifier_tokens(text: str) -> list[str]:
+    """Lowercased words of natural language and code. Identifiers are split into their parts and kept as a whole,
+    so getUserName matches both "user name" in a requirement and other uses of getUserName."""
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        parts = IDENTIFIER_PART_PATTERN.findall(word)
+        tokens.extend(part.lower() for part in parts)
+        if len(parts) > 1:
+            tokens.append(word.lower())
+    return tokens
+
+
+class TfidfEmbeddingCreator(EmbeddingCreator):
+    """Local lexical embeddings without a network service. All elements of a call are embedded in one pass.
+
+    vectorizer "tfidf" learns its vocabulary and idf weights in fit, which the controller calls with all target
+    elements before ingestion, and embeds all elements with them. "hashing" uses term counts without a vocabulary,
+    so its vectors do not depend on other elements.
+    With svd_components, the vectors are projected onto that many dimensions fitted in fit as well.
+    Embeddings are L2-normalized, so cosine, ip and l2 rank them alike."""
+    __vectorizer: Pipeline
+    __svd_components: int
+    __requires_fit: bool
+    __fitted: bool
+    __lock: threading.Lock
+
+    def __init__(self, configuration: ModuleConfiguration):
+        vectorizer = configuration.args.setdefault("vectorizer", "tfidf")
+        n_features = configuration.args.setdefault("n_features", 4096)
+        ngram_range = tuple(configuration.args.setdefault("ngram_range", [1, 1]))
+        stop_words = configuration.args.setdefault("stop_words", "english")
+        svd_components = configuration.args.setdefault("svd_components", 0)
+
+        if vectorizer == "tfidf":
+            steps = [TfidfVectorizer(tokenizer=identifier_tokens, lowercase=False, token_pattern=None,
+                                     stop_words=stop_words, ngram_range=ngram_range, max_features=n_features,
+                                     sublinear_tf=True)]
+        elif vectorizer == "hashing":
+            steps = [HashingVectorizer(tokenizer=identifier_tokens, lowercase=False, token_pattern=None,
+                                       stop_words=stop_words, ngram_range=ngram_range, n_features=n_features,
+                                       alternate_sign=False, norm=None)]
+        else:
+            raise ValueError(f"Unknown vectorizer {vectorizer}, expected tfidf or hashing")
+        if svd_components:
+            steps.append(TruncatedSVD(n_components=svd_components,
+                                      random_state=configuration.args.setdefault("seed", 0)))
+        steps.append(Normalizer())
+        self.__vectorizer = make_pipeline(*steps)
+        self.__svd_components = svd_components
+        self.__requires_fit = vectorizer == "tfidf" or bool(svd_components)
+        self.__fitted = False
+        self.__lock = threading.Lock()
+
+    def requires_fit(self) -> bool:
+        return self.__requires_fit
+
+    def fit(self, elements: Iterable[Element]):
+        with self.__lock:
+            self.__fit(element.content for element in elements)
+
+    def calculate_embedding(self, element: Element) -> Embedding:
+        return self.calculate_multiple_embeddings([element])[0]
+
+    def calculate_multiple_embeddings(self, elements: list[Element]) -> list[Embedding]:
+        if not elements:
+            return []
+        contents = [element.content for element in elements]
+        with self.__lock:
+            if not self.__fitted:
+                if self.__requires_fit:
+                    raise RuntimeError(f"{type(self.__vectorizer[0]).__name__} is not fitted, "
+                                       f"call fit with the corpus before calculating embeddings")
+                # Without a vocabulary and svd the vectors do not depend on the fitted elements
+                self.__fit(contents)
+        vectors = self.__vectorizer.transform(contents)
+        if not isinstance(vectors, np.ndarray):
+            vectors = vectors.toarray()
+        return [Embedding(embedding=vector.tolist()) for vector in vectors.astype(np.float32)]
+
+    def __fit(self, contents: Iterable[str]):
+        """Fits the steps of the pipeline one after the other, the contents are iterated once."""
+        contents = iter(contents)
+        first = next(contents, None)
+        if first is None:
+            raise ValueError(f"{type(self.__vectorizer[0]).__name__} cannot be fitted without elements")
+        vectors = self.__vectorizer[0].fit_transform(itertools.chain([first], contents))
+        for _, step in self.__vectorizer.steps[1:]:
+            if isinstance(step, TruncatedSVD):
+                # TruncatedSVD needs fewer components than samples and features
+                step.n_components = max(1, min(self.__svd_components, vectors.shape[0] - 1, vectors.shape[1] - 1))
+            vectors = step.fit_transform(vectors)
+        print(f"Fitted {type(self.__vectorizer[0]).__name__} on {vectors.shape[0]} elements")
+        self.__fitted = True
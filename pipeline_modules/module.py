@@ -17,4 +17,6 @@ class PipelineConfiguration:
     target_store: ModuleConfiguration
     classifier: ModuleConfiguration
     result_aggregator: ModuleConfiguration
+    # Options of the controller itself, from the optional "controller" section of the configuration
+    controller: dict[str, typing.Any]
 
@@ -0,0 +1,91 @@
+import itertools
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from cache.cache_manager import CacheManager
+from .preprocessor import Preprocessor
+from ..knowledge import Artifact, Element
+from ..module import ModuleConfiguration
+
+
+class CachedPreprocessor(Preprocessor, ABC):
+    """Base class for preprocessors caching the elements they create.
+    All elements of an artifact are stored as a single cache entry.
+    Subclasses implement preprocess_uncached."""
+    __configuration: ModuleConfiguration
+
+    def __init__(self, configuration: ModuleConfiguration):
+        self.__configuration = configuration
+
+    @abstractmethod
+    def preprocess_uncached(self, artifact: Artifact) -> list[Element]:
+        ...
+
+    def preprocess(self, artifact: Artifact) -> list[Element]:
+        return self.preprocess_many([artifact])[0]
+
+    def preprocess_many(self, artifacts: list[Artifact]) -> list[list[Element]]:
+        """Preprocesses the artifacts, looking up and storing their cache entries in one transaction each."""
+        results = self.get_cached(artifacts)
+        uncached = [index for index, elements in enumerate(results) if elements is None]
+        for index in uncached:
+            results[index] = self.preprocess_uncached(artifacts[index])
+        self.put_cached([artifacts[index] for index in uncached], [results[index] for index in uncached])
+        return results
+
+    def preprocess_parallel(self, artifacts: Iterable[Artifact], processes: int,
+                            chunk_size: int) -> Iterator[list[Element]]:
+        """Yields the elements of every artifact in the order of the artifacts.
+        Uncached artifacts are preprocessed by a pool of processes, which receive them in chunks of chunk_size.
+        Cache entries are read and written by this process only. The elements of an artifact are linked to
+        the given artifact object like with preprocess."""
+        # Imported here, the worker module imports all preprocessors
+        from . import preprocessing_worker
+        artifacts = iter(artifacts)
+        # Artifacts looked up and preprocessed at once, enough to keep all processes busy
+        window_size = max(1, processes) * max(1, chunk_size) * 4
+        with ProcessPoolExecutor(max_workers=processes, initializer=preprocessing_worker.initialize,
+                                 initargs=(self.__configuration,)) as executor:
+            while window := list(itertools.islice(artifacts, window_size)):
+                results = self.get_cached(window)
+                uncached = [index for index, elements in enumerate(results) if elements is None]
+                element_dicts = executor.map(preprocessing_worker.preprocess, [window[index] for index in uncached],
+                                             chunksize=max(1, chunk_size))
+                for index, artifact_element_dicts in zip(uncached, element_dicts):
+                    results[index] = self.__elements_from_dicts(artifact_element_dicts, window[index])
+                self.put_cached([window[index] for index in uncached], [results[index] for index in uncached])
+                yield from results
+
+    def get_cached(self, artifacts: list[Artifact]) -> list[list[Element] | None]:
+        """Returns the cached elements of each artifact or None if it has not been preprocessed before."""
+        data = CacheManager.get_cache().get_many(configuration=self.__configuration,
+                                                 input_keys=[artifact.to_json() for artifact in artifacts])
+        return [self.__elements_from_cache(rows) for rows in data]
+
+    def put_cached(self, artifacts: list[Artifact], elements: list[list[Element]]):
+        entries = [(artifact.to_json(), {"elements": [element.to_dict() for element in artifact_elements]})
+                   for artifact, artifact_elements in zip(artifacts, elements)]
+        if entries:
+            CacheManager.get_cache().put_many(configuration=self.__configuration, entries=entries)
+
+    def __elements_from_cache(self, rows: list[dict]) -> list[Element] | None:
+        if not rows:
+            return None
+        # Caches written by older versions store one row per element
+        element_dicts = rows[0]["elements"] if "elements" in rows[0] else rows
+        return self.__elements_from_dicts(element_dicts)
+
+    @staticmethod
+    def __elements_from_dicts(element_dicts: list[dict], artifact: Artifact | None = None) -> list[Element]:
+        """Recreates the elements and their parent links. An element equal to artifact is replaced by artifact."""
+        artifact_dict = artifact.to_dict() if artifact is not None else None
+        elements = [artifact if element_dict == artifact_dict else Element.element_from_dict(element_dict)
+                    for element_dict in element_dicts]
+        elements_by_identifier = {element.identifier: element for element in elements}
+        for element, element_dict in zip(elements, element_dicts):
+            if element is artifact:
+                continue
+            parent = element_dict["parent"]
+            element.parent = elements_by_identifier[parent] if parent is not None else None
+        return elements
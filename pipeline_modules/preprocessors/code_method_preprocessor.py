@@ -2,39 +2,17 @@ import tree_sitter
 from tree_sitter import Node, Parser
 from tree_sitter_languages import get_language
 
-from cache.cache_manager import CacheManager
-from .preprocessor import Preprocessor
+from .cached_preprocessor import CachedPreprocessor
 from ..knowledge import Element, Artifact
 from ..module import ModuleConfiguration
 
 
-class CodeMethodPreprocessor(Preprocessor):
-    __configuration: ModuleConfiguration
+class CodeMethodPreprocessor(CachedPreprocessor):
     __language: str
 
     def __init__(self, configuration: ModuleConfiguration):
         self.__language = configuration.args["language"]
-        self.__configuration = configuration
-        pass
-
-    def __get_cached(self, artifact: Element) -> list[Element]:
-        # TODO: refactor out caching to another class (same as simple_text_preprocessor and sentence_preprocessor)
-
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=artifact.to_json())
-        elements: list[Element] = list()
-        parent_mapping: dict[str, str] = {}
-
-        for element_dict in data:
-            element = Element.element_from_dict(element_dict)
-            elements.append(element)
-            parent_mapping[element.identifier] = element_dict["parent"]
-
-        for element in elements:
-            if parent_mapping[element.identifier] is not None:
-                element.parent = [e for e in elements if e.identifier == parent_mapping[element.identifier]][0]
-            else:
-                element.parent = None
-        return elements
+        super().__init__(configuration)
 
     def __get_language(self) -> tree_sitter.Language:
         if self.__language == "java":
@@ -60,11 +38,8 @@ class CodeMethodPreprocessor(Preprocessor):
                 classes += self.__get_class_bodies(child)
             return classes
 
-    def preprocess(self, artifact: Artifact) -> list[Element]:
-        elements = self.__get_cached(artifact)
-        if elements:
-            return elements
-        elements.append(artifact)
+    def preprocess_uncached(self, artifact: Artifact) -> list[Element]:
+        elements: list[Element] = [artifact]
 
         parser = Parser()
         parser.set_language(get_language(self.__language))
@@ -100,7 +75,4 @@ class CodeMethodPreprocessor(Preprocessor):
             class_start = class_body.end_byte
             i = i + 1
 
-        for element in elements:
-            CacheManager.get_cache().put(configuration=self.__configuration, input=artifact.to_json(),
-                                         data=element.to_dict())
         return elements
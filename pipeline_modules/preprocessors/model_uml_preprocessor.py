@@ -1,45 +1,20 @@
 import xml.etree.ElementTree as ET
 
-from cache.cache_manager import CacheManager
-from .preprocessor import Preprocessor
+from .cached_preprocessor import CachedPreprocessor
 from ..knowledge import Element, Artifact
 from ..module import ModuleConfiguration
 
 
-class ModelUMLPreprocessor(Preprocessor):
-    __configuration: ModuleConfiguration
-
+class ModelUMLPreprocessor(CachedPreprocessor):
     def __init__(self, configuration: ModuleConfiguration):
         self.use_prefix = configuration.args.setdefault('use_prefix', True)
         self.include_usages = configuration.args.setdefault('include_usages', True)
         self.include_operations = configuration.args.setdefault('include_operations', True)
         self.include_interface_realizations = configuration.args.setdefault('include_interface_realizations', True)
-        self.__configuration = configuration
-
-    def __get_cached(self, artifact: Element) -> list[Element]:
-        # TODO: refactor out caching to another class (same as simple_text_preprocessor)
-
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=artifact.to_json())
-        elements: list[Element] = list()
-        parent_mapping: dict[str, str] = {}
-
-        for element_dict in data:
-            element = Element.element_from_dict(element_dict)
-            elements.append(element)
-            parent_mapping[element.identifier] = element_dict["parent"]
-
-        for element in elements:
-            if parent_mapping[element.identifier] is not None:
-                element.parent = [e for e in elements if e.identifier == parent_mapping[element.identifier]][0]
-            else:
-                element.parent = None
-        return elements
+        super().__init__(configuration)
 
-    def preprocess(self, artifact: Artifact) -> list[Element]:
-        elements = self.__get_cached(artifact)
-        if elements:
-            return elements
-        elements.append(artifact)
+    def preprocess_uncached(self, artifact: Artifact) -> list[Element]:
+        elements: list[Element] = [artifact]
 
         # TODO: parse namespace instead of hardcoding
         ns = {
@@ -87,7 +62,4 @@ class ModelUMLPreprocessor(Preprocessor):
             i = i+1
             print(element.identifier)
 
-        for element in elements:
-            CacheManager.get_cache().put(configuration=self.__configuration, input=artifact.to_json(),
-                                         data=element.to_dict())
         return elements
@@ -0,0 +1,19 @@
+"""Entry points of the processes of CachedPreprocessor.preprocess_parallel.
+
+Processes started with spawn (the default on Windows and macOS) import this module first to unpickle the entry points.
+It only imports the preprocessor builder, which imports the preprocessors in an order without circular imports."""
+from .preprocessor import Preprocessor, PreprocessorBuilder
+from ..knowledge import Artifact
+from ..module import ModuleConfiguration
+
+# Preprocessor of this worker process
+_preprocessor: Preprocessor | None = None
+
+
+def initialize(configuration: ModuleConfiguration):
+    global _preprocessor
+    _preprocessor = PreprocessorBuilder().build_preprocessor(configuration)
+
+
+def preprocess(artifact: Artifact) -> list[dict]:
+    return [element.to_dict() for element in _preprocessor.preprocess_uncached(artifact)]
@@ -1,4 +1,4 @@
-from typing import Protocol
+from typing import Iterable, Iterator, Protocol
 
 from ..knowledge import Artifact, Element
 from ..module import ModuleConfiguration
@@ -8,6 +8,11 @@ class Preprocessor(Protocol):
     def preprocess(self, artifact: Artifact) -> list[Element]:
         ...
 
+    def preprocess_parallel(self, artifacts: Iterable[Artifact], processes: int,
+                            chunk_size: int) -> Iterator[list[Element]]:
+        """Yields the elements of every artifact in the order of the artifacts, preprocessed by processes processes."""
+        ...
+
 
 class PreprocessorBuilder:
     from .simple_text_preprocessor import SimpleTextPreprocessor
@@ -1,47 +1,22 @@
 import pysbd
 
-from cache.cache_manager import CacheManager
-from .preprocessor import Preprocessor
+from .cached_preprocessor import CachedPreprocessor
 from ..knowledge import Element, Artifact
 from ..module import ModuleConfiguration
 
 
-class SentenceSplitterPreprocessor(Preprocessor):
+class SentenceSplitterPreprocessor(CachedPreprocessor):
     """Split artifact text into Elements containing a single sentence."""
-    __configuration: ModuleConfiguration
     __language: str
     __clean: bool
 
     def __init__(self, configuration: ModuleConfiguration):
         self.__language = configuration.args.setdefault("language", "en")
         self.__clean = configuration.args.setdefault("clean_text", False)
-        self.__configuration = configuration
-        pass
+        super().__init__(configuration)
 
-    def __get_cached(self, artifact: Element) -> list[Element]:
-        # TODO: refactor out caching to another class (same as simple_text_preprocessor)
-
-        data = CacheManager.get_cache().get(configuration=self.__configuration, input_key=artifact.to_json())
-        elements: list[Element] = list()
-        parent_mapping: dict[str, str] = {}
-
-        for element_dict in data:
-            element = Element.element_from_dict(element_dict)
-            elements.append(element)
-            parent_mapping[element.identifier] = element_dict["parent"]
-
-        for element in elements:
-            if parent_mapping[element.identifier] is not None:
-                element.parent = [e for e in elements if e.identifier == parent_mapping[element.identifier]][0]
-            else:
-                element.parent = None
-        return elements
-
-    def preprocess(self, artifact: Artifact) -> list[Element]:
-        elements = self.__get_cached(artifact)
-        if elements:
-            return elements
-        elements.append(artifact)
+    def preprocess_uncached(self, artifact: Artifact) -> list[Element]:
+        elements: list[Element] = [artifact]
 
         segmenter = pysbd.Segmenter(language=self.__language, clean=self.__clean)
         segments: list[str] = segmenter.segment(artifact.content)
@@ -57,7 +32,4 @@ class SentenceSplitterPreprocessor(Preprocessor):
             elements.append(element)
             i = i + 1
 
-        for element in elements:
-            CacheManager.get_cache().put(configuration=self.__configuration, input=artifact.to_json(),
-                                         data=element.to_dict())
         return elements
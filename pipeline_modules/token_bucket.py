@@ -0,0 +1,29 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Limits the number of tokens sent per minute. Requests larger than the limit wait for a full bucket."""
+    __capacity: float
+    __tokens: float
+    __updated: float
+    __lock: threading.Lock
+
+    def __init__(self, tokens_per_minute: int):
+        self.__capacity = tokens_per_minute
+        self.__tokens = tokens_per_minute
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        tokens = min(tokens, self.__capacity)
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__capacity / 60)
+                self.__updated = now
+                if self.__tokens >= tokens:
+                    self.__tokens -= tokens
+                    return
+                wait = (tokens - self.__tokens) * 60 / self.__capacity
+            time.sleep(wait)